@@ -4,7 +4,6 @@ Attributes:
     AWS_CIS_BENCHMARK_VERSION (str): Description
     CONFIG_RULE (bool): Description
     CONTROL_1_1_DAYS (int): Description
-    IAM_CLIENT (TYPE): Description
     REGIONS (list): Description
     S3_WEB_REPORT (bool): Description
     S3_WEB_REPORT_BUCKET (str): Description
@@ -22,8 +21,40 @@ import re
 import tempfile
 import getopt
 import os
+import threading
+import calendar
+import hashlib
+import socket
+import binascii
+import base64
+import gzip
+import io
+import functools
+from array import array
+from collections import namedtuple
 from datetime import datetime
+from multiprocessing import Pipe, Process
+from multiprocessing.pool import ThreadPool
 import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, DeferredRefreshableCredentials
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+from botocore.utils import parse_timestamp
+from botocore.exceptions import ClientError
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    intern
+except NameError:
+    from sys import intern
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 
 # --- Script controls ---
@@ -62,6 +93,90 @@ SCRIPT_OUTPUT_JSON = True
 # If using S3 reporting, please enable SNS integration to get S3 signed URL
 OUTPUT_ONLY_JSON = False
 
+# How many regions should the region-scoped controls evaluate in parallel?
+# Override with the REGION_WORKERS environment variable (Lambda) or -w/--workers (CLI).
+REGION_WORKERS = int(os.environ.get("REGION_WORKERS", "8"))
+
+# How many controls and data sources should run in parallel, see run_scheduled()? 1 runs them one by one in
+# CONTROL_REGISTRY order. Override with the CONTROL_WORKERS environment variable (Lambda) or --control-workers (CLI).
+CONTROL_WORKERS = int(os.environ.get("CONTROL_WORKERS", "4"))
+
+# How many seconds may the scheduler wait for any control or data source to finish before the run fails?
+TASK_TIMEOUT = 3600
+
+# How many HTTP connections may each shared boto3 client keep open?
+# Keep this at least as high as REGION_WORKERS, and CONTROL_WORKERS times IAM_LOOKUP_WORKERS.
+CLIENT_MAX_POOL_CONNECTIONS = 25
+
+# How many IAM users may be looked up in parallel when the credential report alone is not enough (control 1.23)?
+IAM_LOOKUP_WORKERS = 4
+
+# How many CloudTrail buckets may be inspected in parallel (controls 2.3 and 2.6)?
+TRAIL_BUCKET_WORKERS = 4
+
+# How many KMS keys may be checked in parallel per region (control 2.8)?
+KMS_KEY_WORKERS = 4
+
+# Where should data reused between runs (credential reports, ...) be cached?
+# Lambda can only write to /tmp. Override with the CACHE_DIR environment variable or --cache-dir.
+if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+    CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/aws-cis-benchmark")
+else:
+    CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aws-cis-benchmark"))
+
+# How many hours old may a credential report be and still be reused? AWS refreshes it at most every 4 hours.
+# Set to 0 to always generate a new report. Override with CRED_REPORT_MAX_AGE or --cred-report-max-age.
+CRED_REPORT_MAX_AGE = float(os.environ.get("CRED_REPORT_MAX_AGE", "4"))
+
+# Should control results be reused when the data they are evaluated on is unchanged since the last run?
+# "local" stores results in CACHE_DIR, "s3" in CONTROL_RESULT_CACHE_BUCKET (survives Lambda cold starts), None disables.
+CONTROL_RESULT_CACHE = None
+CONTROL_RESULT_CACHE_BUCKET = S3_WEB_REPORT_BUCKET
+CONTROL_RESULT_CACHE_PREFIX = "control-results/"
+# How many hours may a stored control result be reused while the data it was evaluated on is unchanged?
+CONTROL_RESULT_MAX_AGE = 24
+
+# Which role should the organization scan (--accounts or --org) assume in every account? Override with --role-name.
+ORG_SCAN_ROLE_NAME = "OrganizationAccountAccessRole"
+
+# How many accounts should the organization scan evaluate in parallel processes? Override with --processes.
+ORG_SCAN_PROCESSES = 4
+
+# Where should the organization scan write the result of every account and the fleet rollup? Override with --output-dir.
+ORG_SCAN_OUTPUT_DIR = "cis-benchmark-results"
+
+# Should credentials of assumed roles (organization scan) also be cached in CACHE_DIR, for later runs?
+# They are always cached in memory. Files are readable by the current user only.
+STS_CREDENTIAL_CACHE = True
+
+# How many seconds before expiry should assumed role credentials be refreshed in the background?
+# Keep this above the 15 minutes before expiry at which boto3 refreshes on demand.
+STS_REFRESH_AHEAD = 1200
+
+# Record every AWS API response of a run as gzip JSON in RECORD_DIR (--record), or serve the responses
+# recorded in REPLAY_DIR instead of calling AWS (--replay), to measure and test the script without AWS.
+# Use an empty --cache-dir for both, cached data changes which calls are made.
+RECORD_DIR = None
+REPLAY_DIR = None
+
+# Delay replayed responses? None for no delay, "recorded" for the latency seen when recording,
+# or a number of seconds. Override with --replay-latency.
+REPLAY_LATENCY = None
+
+# Should IAM policy evaluations (control 1.24) be stored in CACHE_DIR and reused by later runs and other accounts?
+POLICY_EVALUATION_CACHE = True
+
+# Record the wall time and AWS API calls (per service and operation, with retries, throttles, bytes received
+# and pages) of every control? Added as a Metrics block to the JSON output and as a run summary table to the
+# HTML report. Enable with --metrics, or the CONTROL_METRICS environment variable when running as Lambda.
+CONTROL_METRICS = os.environ.get("CONTROL_METRICS", "false").lower() == "true"
+
+# Evaluate only some controls? Comma separated control ids (like "4.1,4.3") and section numbers (like "2,3"),
+# None for all. Controls selected by either are evaluated, and only the data they need is fetched. Override with
+# --controls and --sections (CLI), or the controls and sections fields of the event or of the Config rule parameters.
+SELECTED_CONTROLS = None
+SELECTED_SECTIONS = None
+
 
 # --- Control Parameters ---
 
@@ -74,10 +189,188 @@ IAM_MANAGER_POLICY = "iam_manager_policy"
 # Control 1.1 - Days allowed since use of root account.
 CONTROL_1_1_DAYS = 0
 
+# Control 4.5 - Shortest prefix allowed for a route to a VPC peering connection, broader routes are flagged.
+CONTROL_4_5_IPV4_PREFIX = 24
+CONTROL_4_5_IPV6_PREFIX = 64
+
+# Control 3.1 - 3.14 - Metric filter patterns per control, all patterns of a control must match the filter.
+METRIC_FILTER_PATTERNS = {
+    "3.1": [
+        r'\$\.errorCode\s*=\s*"?\*UnauthorizedOperation("|\)|\s)',
+        r'\$\.errorCode\s*=\s*"?AccessDenied\*("|\)|\s)',
+    ],
+    "3.2": [
+        r'\$\.eventName\s*=\s*"?ConsoleLogin("|\)|\s)',
+        r'\$\.additionalEventData\.MFAUsed\s*\!=\s*"?Yes',
+    ],
+    "3.3": [
+        r'\$\.userIdentity\.type\s*=\s*"?Root',
+        r'\$\.userIdentity\.invokedBy\s*NOT\s*EXISTS',
+        r'\$\.eventType\s*\!=\s*"?AwsServiceEvent("|\)|\s)',
+    ],
+    "3.4": [
+        r'\$\.eventName\s*=\s*"?DeleteGroupPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteRolePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteUserPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutGroupPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutRolePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutUserPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreatePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeletePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreatePolicyVersion("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeletePolicyVersion("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AttachRolePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DetachRolePolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AttachUserPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DetachUserPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AttachGroupPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DetachGroupPolicy("|\)|\s)',
+    ],
+    "3.5": [
+        r'\$\.eventName\s*=\s*"?CreateTrail("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?UpdateTrail("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteTrail("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?StartLogging("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?StopLogging("|\)|\s)',
+    ],
+    "3.6": [
+        r'\$\.eventName\s*=\s*"?ConsoleLogin("|\)|\s)',
+        r'\$\.errorMessage\s*=\s*"?Failed authentication("|\)|\s)',
+    ],
+    "3.7": [
+        r'\$\.eventSource\s*=\s*"?kms\.amazonaws\.com("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DisableKey("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ScheduleKeyDeletion("|\)|\s)',
+    ],
+    "3.8": [
+        r'\$\.eventSource\s*=\s*"?s3\.amazonaws\.com("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutBucketAcl("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutBucketPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutBucketCors("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutBucketLifecycle("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutBucketReplication("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteBucketPolicy("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteBucketCors("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteBucketLifecycle("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteBucketReplication("|\)|\s)',
+    ],
+    "3.9": [
+        r'\$\.eventSource\s*=\s*"?config\.amazonaws\.com("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?StopConfigurationRecorder("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteDeliveryChannel("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutDeliveryChannel("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?PutConfigurationRecorder("|\)|\s)',
+    ],
+    "3.10": [
+        r'\$\.eventName\s*=\s*"?AuthorizeSecurityGroupIngress("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AuthorizeSecurityGroupEgress("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?RevokeSecurityGroupIngress("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?RevokeSecurityGroupEgress("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreateSecurityGroup("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteSecurityGroup("|\)|\s)',
+    ],
+    "3.11": [
+        r'\$\.eventName\s*=\s*"?CreateNetworkAcl("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreateNetworkAclEntry("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteNetworkAcl("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteNetworkAclEntry("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ReplaceNetworkAclEntry("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ReplaceNetworkAclAssociation("|\)|\s)',
+    ],
+    "3.12": [
+        r'\$\.eventName\s*=\s*"?CreateCustomerGateway("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteCustomerGateway("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AttachInternetGateway("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreateInternetGateway("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteInternetGateway("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DetachInternetGateway("|\)|\s)',
+    ],
+    "3.13": [
+        r'\$\.eventName\s*=\s*"?CreateRoute("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreateRouteTable("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ReplaceRoute("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ReplaceRouteTableAssociation("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteRouteTable("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteRoute("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DisassociateRouteTable("|\)|\s)',
+    ],
+    "3.14": [
+        r'\$\.eventName\s*=\s*"?CreateVpc("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteVpc("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?ModifyVpcAttribute("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AcceptVpcPeeringConnection("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?CreateVpcPeeringConnection("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DeleteVpcPeeringConnection("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?RejectVpcPeeringConnection("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?AttachClassicLinkVpc("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DetachClassicLinkVpc("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?DisableVpcClassicLink("|\)|\s)',
+        r'\$\.eventName\s*=\s*"?EnableVpcClassicLink("|\)|\s)',
+    ],
+}
+
 
 # --- Global ---
-IAM_CLIENT = boto3.client('iam')
-S3_CLIENT = boto3.client('s3')
+# Shared clients keyed by (session, service, region), see get_client()
+CLIENTS = {}
+# boto3 sessions are not thread safe, client creation from region workers is serialized
+CLIENT_LOCK = threading.Lock()
+CLIENT_CONFIG = Config(max_pool_connections=CLIENT_MAX_POOL_CONNECTIONS)
+# S3 calls made per CloudTrail bucket by get_trail_buckets(), errors are stored as <name>Error
+TRAIL_BUCKET_CALLS = (('Acl', 'get_bucket_acl'), ('Logging', 'get_bucket_logging'), ('PolicyStatus', 'get_bucket_policy_status'))
+# Maximum number of trail ARNs per describe_trails call
+TRAIL_DESCRIBE_CHUNK = 20
+# Maximum number of VPC ids per describe_flow_logs filter
+FLOW_LOG_FILTER_CHUNK = 200
+# KMS errors that mean a key cannot be checked for rotation, see control_2_8_ensure_kms_cmk_rotation()
+KMS_SKIPPED_ERRORS = ('AccessDeniedException', 'KMSInvalidStateException', 'UnsupportedOperationException', 'NotFoundException')
+# Assumed role credentials per (role ARN, session name), see get_role_credentials()
+ROLE_CREDENTIALS = {}
+ROLE_CREDENTIALS_LOCK = threading.Lock()
+# Recorded and replayed API responses per call key, see attach_recorder()
+RECORDING = {}
+RECORDING_LOCK = threading.Lock()
+REPLAY = {}
+REPLAY_POSITIONS = {}
+# Operations whose parameters differ between runs (uploaded content, report names, timestamps). When replayed,
+# they get the responses recorded for the same operation, any other call must match a recorded call exactly.
+REPLAY_FALLBACK_OPERATIONS = ('PutObject', 'CreateMultipartUpload', 'UploadPart', 'CompleteMultipartUpload', 'Publish', 'PutEvaluations')
+# Account the recorded calls belong to in an organization scan, part of every call key
+RECORD_SCOPE = ""
+# Guards the stored control results of the current run, see run_control()
+CONTROL_RESULTS_LOCK = threading.Lock()
+SCRIPT_FINGERPRINT = {}
+# Policy evaluations per normalized document hash, see policy_grants_admin()
+POLICY_EVALUATIONS = {}
+POLICY_EVALUATIONS_LOCK = threading.Lock()
+# Change when the rules in statement_grants_admin() change, invalidates stored evaluations
+POLICY_RULES_VERSION = "1"
+# Metrics of the control running in the current thread, see run_control() and attach_metrics()
+METRICS_CONTEXT = threading.local()
+# Metrics of the API calls made outside of any control (shared data, report upload)
+RUN_METRICS = {}
+METRICS_LOCK = threading.Lock()
+# Error codes counted as throttles, the throttling errors botocore retries
+THROTTLING_ERRORS = ('Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'TooManyRequestsException',
+                     'ProvisionedThroughputExceededException', 'TransactionInProgressException', 'RequestLimitExceeded',
+                     'BandwidthLimitExceeded', 'LimitExceededException', 'RequestThrottled', 'SlowDown', 'EC2ThrottledException')
+# Data shared between controls during one run, see run_cached()
+RUN_CACHE = {}
+RUN_CACHE_KEY_LOCKS = {}
+RUN_CACHE_LOCK = threading.Lock()
+# Settings that can change after import, passed to the account processes of an organization scan
+ORG_SCAN_SETTINGS = ('REGION_WORKERS', 'CONTROL_WORKERS', 'CACHE_DIR', 'CRED_REPORT_MAX_AGE', 'CONTROL_RESULT_CACHE', 'CONTROL_RESULT_MAX_AGE',
+                     'STS_CREDENTIAL_CACHE', 'RECORD_DIR', 'REPLAY_DIR', 'REPLAY_LATENCY', 'POLICY_EVALUATION_CACHE', 'CONTROL_METRICS', 'SELECTED_CONTROLS', 'SELECTED_SECTIONS')
+# METRIC_FILTER_PATTERNS compiled once. Each regex is paired with the literals it requires, the field
+# (for example $.eventName) and the value (for example ConsoleLogin), used to skip regexes that cannot match.
+METRIC_FILTER_REGISTRY = []
+for control in sorted(METRIC_FILTER_PATTERNS):
+    compiledPatterns = []
+    for pattern in METRIC_FILTER_PATTERNS[control]:
+        literals = [re.sub(r'\\(.)', r'\1', re.match(r'(?:\\[$.]|\w)+', pattern).group(0))]
+        literals.extend(re.findall(r'"\?(?:\\\*)?(\w+)', pattern))
+        compiledPatterns.append((literals, re.compile(pattern)))
+    METRIC_FILTER_REGISTRY.append((control, compiledPatterns))
 
 
 # --- 1 Identity and Access Management ---
@@ -98,43 +391,18 @@ def control_1_1_root_use(credreport):
     control = "1.1"
     description = "Avoid the use of the root account"
     scored = True
-    if "Fail" in credreport:  # Report failure in control
-        sys.exit(credreport)
+    if not isinstance(credreport, CredentialReport):  # Report failure in control
+        raise RuntimeError(credreport)
     # Check if root is used in the last 24h
-    now = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time()))
-    frm = "%Y-%m-%dT%H:%M:%S+00:00"
-
-    try:
-        pwdDelta = (datetime.strptime(now, frm) - datetime.strptime(credreport[0]['password_last_used'], frm))
-        if (pwdDelta.days == CONTROL_1_1_DAYS) & (pwdDelta.seconds > 0):  # Used within last 24h
-            failReason = "Used within 24h"
-            result = False
-    except:
-        if credreport[0]['password_last_used'] == "N/A" or "no_information":
-            pass
-        else:
-            print("Something went wrong")
-
-    try:
-        key1Delta = (datetime.strptime(now, frm) - datetime.strptime(credreport[0]['access_key_1_last_used_date'], frm))
-        if (key1Delta.days == CONTROL_1_1_DAYS) & (key1Delta.seconds > 0):  # Used within last 24h
-            failReason = "Used within 24h"
-            result = False
-    except:
-        if credreport[0]['access_key_1_last_used_date'] == "N/A" or "no_information":
-            pass
-        else:
-            print("Something went wrong")
-    try:
-        key2Delta = datetime.strptime(now, frm) - datetime.strptime(credreport[0]['access_key_2_last_used_date'], frm)
-        if (key2Delta.days == CONTROL_1_1_DAYS) & (key2Delta.seconds > 0):  # Used within last 24h
+    now = int(time.time())
+    for column in ('password_last_used', 'access_key_1_last_used_date', 'access_key_2_last_used_date'):
+        lastUsed = credreport.timestamp(0, column)
+        if lastUsed is None:
+            continue  # N/A or no_information, never used
+        delta = now - lastUsed
+        if (delta // 86400 == CONTROL_1_1_DAYS) & (delta % 86400 > 0):  # Used within last 24h
             failReason = "Used within 24h"
             result = False
-    except:
-        if credreport[0]['access_key_2_last_used_date'] == "N/A" or "no_information":
-            pass
-        else:
-            print("Something went wrong")
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -182,42 +450,30 @@ def control_1_3_unused_credentials(credreport):
     description = "Ensure credentials unused for 90 days or greater are disabled"
     scored = True
     # Get current time
-    now = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time()))
-    frm = "%Y-%m-%dT%H:%M:%S+00:00"
-
-    # Look for unused credentails
+    now = int(time.time())
+    passwordEnabled = credreport.column('password_enabled')
+    key1Active = credreport.column('access_key_1_active')
+    key2Active = credreport.column('access_key_2_active')
+    passwordAge = credreport.age_days('password_last_used', now)
+    key1Age = credreport.age_days('access_key_1_last_used_date', now)
+    key2Age = credreport.age_days('access_key_2_last_used_date', now)
+    arns = credreport.column('arn')
+
+    # Look for unused credentails, rows without a date have never been used
     for i in range(len(credreport)):
-        if credreport[i]['password_enabled'] == "true":
-            try:
-                delta = datetime.strptime(now, frm) - datetime.strptime(credreport[i]['password_last_used'], frm)
-                # Verify password have been used in the last 90 days
-                if delta.days > 90:
-                    result = False
-                    failReason = "Credentials unused > 90 days detected. "
-                    offenders.append(str(credreport[i]['arn']) + ":password")
-            except:
-                pass  # Never used
-        if credreport[i]['access_key_1_active'] == "true":
-            try:
-                delta = datetime.strptime(now, frm) - datetime.strptime(credreport[i]['access_key_1_last_used_date'], frm)
-                # Verify password have been used in the last 90 days
-                if delta.days > 90:
-                    result = False
-                    failReason = "Credentials unused > 90 days detected. "
-                    offenders.append(str(credreport[i]['arn']) + ":key1")
-            except:
-                pass
-        if credreport[i]['access_key_2_active'] == "true":
-            try:
-                delta = datetime.strptime(now, frm) - datetime.strptime(credreport[i]['access_key_2_last_used_date'], frm)
-                # Verify password have been used in the last 90 days
-                if delta.days > 90:
-                    result = False
-                    failReason = "Credentials unused > 90 days detected. "
-                    offenders.append(str(credreport[i]['arn']) + ":key2")
-            except:
-                # Never used
-                pass
+        # Verify credentials have been used in the last 90 days
+        if passwordEnabled[i] == "true" and passwordAge[i] is not None and passwordAge[i] > 90:
+            result = False
+            failReason = "Credentials unused > 90 days detected. "
+            offenders.append(str(arns[i]) + ":password")
+        if key1Active[i] == "true" and key1Age[i] is not None and key1Age[i] > 90:
+            result = False
+            failReason = "Credentials unused > 90 days detected. "
+            offenders.append(str(arns[i]) + ":key1")
+        if key2Active[i] == "true" and key2Age[i] is not None and key2Age[i] > 90:
+            result = False
+            failReason = "Credentials unused > 90 days detected. "
+            offenders.append(str(arns[i]) + ":key2")
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -238,51 +494,32 @@ def control_1_4_rotated_keys(credreport):
     description = "Ensure access keys are rotated every 90 days or less"
     scored = True
     # Get current time
-    now = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time()))
-    frm = "%Y-%m-%dT%H:%M:%S+00:00"
+    now = int(time.time())
+    arns = credreport.column('arn')
+
+    active = dict()
+    rotatedAge = dict()
+    for key in ('1', '2'):
+        active[key] = credreport.column('access_key_' + key + '_active')
+        rotatedAge[key] = credreport.age_days('access_key_' + key + '_last_rotated', now)
 
     # Look for unused credentails
     for i in range(len(credreport)):
-        if credreport[i]['access_key_1_active'] == "true":
-            try:
-                delta = datetime.strptime(now, frm) - datetime.strptime(credreport[i]['access_key_1_last_rotated'], frm)
-                # Verify keys have rotated in the last 90 days
-                if delta.days > 90:
-                    result = False
-                    failReason = "Key rotation >90 days or not used since rotation"
-                    offenders.append(str(credreport[i]['arn']) + ":unrotated key1")
-            except:
-                pass
-            try:
-                last_used_datetime = datetime.strptime(credreport[i]['access_key_1_last_used_date'], frm)
-                last_rotated_datetime = datetime.strptime(credreport[i]['access_key_1_last_rotated'], frm)
-                # Verify keys have been used since rotation.
-                if last_used_datetime < last_rotated_datetime:
-                    result = False
-                    failReason = "Key rotation >90 days or not used since rotation"
-                    offenders.append(str(credreport[i]['arn']) + ":unused key1")
-            except:
-                pass
-        if credreport[i]['access_key_2_active'] == "true":
-            try:
-                delta = datetime.strptime(now, frm) - datetime.strptime(credreport[i]['access_key_2_last_rotated'], frm)
-                # Verify keys have rotated in the last 90 days
-                if delta.days > 90:
-                    result = False
-                    failReason = "Key rotation >90 days or not used since rotation"
-                    offenders.append(str(credreport[i]['arn']) + ":unrotated key2")
-            except:
-                pass
-            try:
-                last_used_datetime = datetime.strptime(credreport[i]['access_key_2_last_used_date'], frm)
-                last_rotated_datetime = datetime.strptime(credreport[i]['access_key_2_last_rotated'], frm)
-                # Verify keys have been used since rotation.
-                if last_used_datetime < last_rotated_datetime:
-                    result = False
-                    failReason = "Key rotation >90 days or not used since rotation"
-                    offenders.append(str(credreport[i]['arn']) + ":unused key2")
-            except:
-                pass
+        for key in ('1', '2'):
+            if active[key][i] != "true":
+                continue
+            # Verify keys have rotated in the last 90 days
+            if rotatedAge[key][i] is not None and rotatedAge[key][i] > 90:
+                result = False
+                failReason = "Key rotation >90 days or not used since rotation"
+                offenders.append(str(arns[i]) + ":unrotated key" + key)
+            # Verify keys have been used since rotation.
+            lastUsed = credreport.timestamp(i, 'access_key_' + key + '_last_used_date')
+            lastRotated = credreport.timestamp(i, 'access_key_' + key + '_last_rotated')
+            if lastUsed is not None and lastRotated is not None and lastUsed < lastRotated:
+                result = False
+                failReason = "Key rotation >90 days or not used since rotation"
+                offenders.append(str(arns[i]) + ":unused key" + key)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -513,7 +750,7 @@ def control_1_13_root_mfa_enabled():
     control = "1.13"
     description = "Ensure MFA is enabled for the root account"
     scored = True
-    response = IAM_CLIENT.get_account_summary()
+    response = get_client('iam').get_account_summary()
     if response['SummaryMap']['AccountMFAEnabled'] != 1:
         result = False
         failReason = "Root account not using MFA"
@@ -534,9 +771,9 @@ def control_1_14_root_hardware_mfa_enabled():
     description = "Ensure hardware MFA is enabled for the root account"
     scored = True
     # First verify that root is using MFA (avoiding false positive)
-    response = IAM_CLIENT.get_account_summary()
+    response = get_client('iam').get_account_summary()
     if response['SummaryMap']['AccountMFAEnabled'] == 1:
-        paginator = IAM_CLIENT.get_paginator('list_virtual_mfa_devices')
+        paginator = get_client('iam').get_paginator('list_virtual_mfa_devices')
         response_iterator = paginator.paginate(
             AssignmentStatus='Any',
         )
@@ -583,19 +820,8 @@ def control_1_16_no_policies_on_iam_users():
     control = "1.16"
     description = "Ensure IAM policies are attached only to groups or roles"
     scored = True
-    paginator = IAM_CLIENT.get_paginator('list_users')
-    response_iterator = paginator.paginate()
-    pagedResult = []
-    for page in response_iterator:
-        for n in page['Users']:
-            pagedResult.append(n)
-    offenders = []
-    for n in pagedResult:
-        policies = IAM_CLIENT.list_user_policies(
-            UserName=n['UserName'],
-            MaxItems=1
-        )
-        if policies['PolicyNames'] != []:
+    for n in get_iam_snapshot()['Users']:
+        if n['UserPolicyList'] != []:
             result = False
             failReason = "IAM user have inline policy attached"
             offenders.append(str(n['Arn']))
@@ -670,9 +896,12 @@ def control_1_20_ensure_security_contact_details():
 
 
 # 1.21 Ensure IAM instance roles are used for AWS resource access from instances (Scored)
-def control_1_21_ensure_iam_instance_roles_used():
+def control_1_21_ensure_iam_instance_roles_used(regions):
     """Summary
 
+    Args:
+        regions (list): Region names to evaluate
+
     Returns:
         TYPE: Description
     """
@@ -682,17 +911,25 @@ def control_1_21_ensure_iam_instance_roles_used():
     control = "1.21"
     description = "Ensure IAM instance roles are used for AWS resource access from instances, application code is not audited"
     scored = True
-    failReason = "Instance not assigned IAM role for EC2"
-    client = boto3.client('ec2')
-    response = client.describe_instances()
-    offenders = []
-    for n, _ in enumerate(response['Reservations']):
-        try:
-            if response['Reservations'][n]['Instances'][0]['IamInstanceProfile']:
-                pass
-        except:
-                result = False
-                offenders.append(str(response['Reservations'][n]['Instances'][0]['InstanceId']))
+
+    def region_check(n):
+        regionOffenders = []
+        paginator = get_client('ec2', n).get_paginator('describe_instances')
+        # Instances are evaluated page by page, terminated instances are filtered out by EC2
+        instances = paginator.paginate(
+            Filters=[{'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}],
+            PaginationConfig={'PageSize': 1000}
+        ).search('Reservations[].Instances[]')
+        for m in instances:
+            if 'IamInstanceProfile' not in m:
+                regionOffenders.append(str(n) + " : " + str(m['InstanceId']))
+        return regionOffenders
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "Instance not assigned IAM role for EC2"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -710,16 +947,15 @@ def control_1_22_ensure_incident_management_roles():
     description = "Ensure a support role has been created to manage incidents with AWS Support"
     scored = True
     offenders = []
-    try:
-        response = IAM_CLIENT.list_entities_for_policy(
-            PolicyArn='arn:aws:iam::aws:policy/AWSSupportAccess'
-        )
-        if (len(response['PolicyGroups']) + len(response['PolicyUsers']) + len(response['PolicyRoles'])) == 0:
-            result = False
-            failReason = "No user, group or role assigned AWSSupportAccess"
-    except:
+    snapshot = get_iam_snapshot()
+    attached = 0
+    for entities in (snapshot['Users'], snapshot['Groups'], snapshot['Roles']):
+        for n in entities:
+            if 'arn:aws:iam::aws:policy/AWSSupportAccess' in n['AttachedManagedPolicies']:
+                attached += 1
+    if attached == 0:
         result = False
-        failReason = "AWSSupportAccess policy not created"
+        failReason = "No user, group or role assigned AWSSupportAccess"
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -736,17 +972,24 @@ def control_1_23_no_active_initial_access_keys_with_iam_user(credreport):
     control = "1.23"
     description = "Do not setup access keys during initial user setup for all IAM users that have a console password"
     scored = False
-    offenders = []
-    for n, _ in enumerate(credreport):
-        if (credreport[n]['access_key_1_active'] or credreport[n]['access_key_2_active'] == 'true') and n > 0:
-            response = IAM_CLIENT.list_access_keys(
-                UserName=str(credreport[n]['user'])
-            )
-            for m in response['AccessKeyMetadata']:
-                if re.sub(r"\s", "T", str(m['CreateDate'])) == credreport[n]['user_creation_time']:
-                    result = False
-                    failReason = "Users with keys created at user creation time found"
-                    offenders.append(str(credreport[n]['arn']) + ":" + str(m['AccessKeyId']))
+    # The last rotated date of a key that was never rotated is its creation date,
+    # so keys created together with the user can be found in the report itself
+    candidates = []
+    for i in range(1, len(credreport)):
+        userCreated = credreport.timestamp(i, 'user_creation_time')
+        for key in ('1', '2'):
+            if credreport.value(i, 'access_key_' + key + '_active') == 'true' and \
+                    userCreated is not None and credreport.timestamp(i, 'access_key_' + key + '_last_rotated') == userCreated:
+                candidates.append((i, key, userCreated))
+    # Only the matching users are looked up, for the access key ids
+    keyIds = dict(zip(
+        [(i, key) for i, key, _ in candidates],
+        run_in_pool(IAM_LOOKUP_WORKERS, candidates, lambda n: get_initial_access_key_id(str(credreport.value(n[0], 'user')), n[2]))
+    ))
+    for i, key, _ in candidates:
+        result = False
+        failReason = "Users with keys created at user creation time found"
+        offenders.append(str(credreport.value(i, 'arn')) + ":" + str(keyIds[(i, key)] or "key" + key))
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -764,36 +1007,12 @@ def control_1_24_no_overly_permissive_policies():
     description = "Ensure IAM policies that allow full administrative privileges are not created"
     scored = True
     offenders = []
-    paginator = IAM_CLIENT.get_paginator('list_policies')
-    response_iterator = paginator.paginate(
-        Scope='Local',
-        OnlyAttached=False,
-    )
-    pagedResult = []
-    for page in response_iterator:
-        for n in page['Policies']:
-            pagedResult.append(n)
-    for m in pagedResult:
-        policy = IAM_CLIENT.get_policy_version(
-            PolicyArn=m['Arn'],
-            VersionId=m['DefaultVersionId']
-        )
-
-        statements = []
-        # a policy may contain a single statement, a single statement in an array, or multiple statements in an array
-        if isinstance(policy['PolicyVersion']['Document']['Statement'], list):
-            for statement in policy['PolicyVersion']['Document']['Statement']:
-                statements.append(statement)
-        else:
-            statements.append(policy['PolicyVersion']['Document']['Statement'])
-
-        for n in statements:
-            # a policy statement has to contain either an Action or a NotAction
-            if 'Action' in n.keys() and n['Effect'] == 'Allow':
-                if ("'*'" in str(n['Action']) or str(n['Action']) == "*") and ("'*'" in str(n['Resource']) or str(n['Resource']) == "*"):
-                    result = False
-                    failReason = "Found full administrative policy"
-                    offenders.append(str(m['Arn']))
+    for m in get_iam_snapshot()['Policies']:
+        if policy_grants_admin(m['DefaultDocument']):
+            result = False
+            failReason = "Found full administrative policy"
+            offenders.append(str(m['Arn']))
+    save_policy_evaluations()
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -815,14 +1034,10 @@ def control_2_1_ensure_cloud_trail_all_regions(cloudtrails):
     control = "2.1"
     description = "Ensure CloudTrail is enabled in all regions"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    for m, n in cloudtrails.items():
         for o in n:
             if o['IsMultiRegionTrail']:
-                client = boto3.client('cloudtrail', region_name=m)
-                response = client.get_trail_status(
-                    Name=o['TrailARN']
-                )
-                if response['IsLogging'] is True:
+                if get_trail_status(o)['IsLogging'] is True:
                     result = True
                     break
     if result is False:
@@ -846,7 +1061,7 @@ def control_2_2_ensure_cloudtrail_validation(cloudtrails):
     control = "2.2"
     description = "Ensure CloudTrail log file validation is enabled"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    for m, n in cloudtrails.items():
         for o in n:
             if o['LogFileValidationEnabled'] is False:
                 result = False
@@ -873,13 +1088,21 @@ def control_2_3_ensure_cloudtrail_bucket_not_public(cloudtrails):
     control = "2.3"
     description = "Ensure the S3 bucket CloudTrail logs to is not publicly accessible"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    buckets = get_trail_buckets(cloudtrails)
+    for m, n in cloudtrails.items():
         for o in n:
             #  We only want to check cases where there is a bucket
             if "S3BucketName" in str(o):
                 try:
-                    response = S3_CLIENT.get_bucket_acl(Bucket=o['S3BucketName'])
-                    for p in response['Grants']:
+                    bucket = buckets[o['S3BucketName']]
+                    if 'AclError' in bucket:
+                        raise bucket['AclError']
+                    if bucket.get('PolicyStatus', {}).get('IsPublic') is True:
+                        result = False
+                        offenders.append(str(o['TrailARN']) + ":PublicBucket")
+                        if "Publically" not in failReason:
+                            failReason = failReason + "Publically accessible CloudTrail bucket discovered."
+                    for p in bucket['Acl']['Grants']:
                         # print("Grantee is " + str(p['Grantee']))
                         if re.search(r'(global/AllUsers|global/AuthenticatedUsers)', str(p['Grantee'])):
                             result = False
@@ -923,7 +1146,7 @@ def control_2_4_ensure_cloudtrail_cloudwatch_logs_integration(cloudtrails):
     control = "2.4"
     description = "Ensure CloudTrail trails are integrated with CloudWatch Logs"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    for m, n in cloudtrails.items():
         for o in n:
             try:
                 if "arn:aws:logs" in o['CloudWatchLogsLogGroupArn']:
@@ -953,34 +1176,31 @@ def control_2_5_ensure_config_all_regions(regions):
     description = "Ensure AWS Config is enabled in all regions"
     scored = True
     globalConfigCapture = False  # Only one region needs to capture global events
-    for n in regions:
-        configClient = boto3.client('config', region_name=n)
+
+    def region_check(n):
+        regionOffenders = []
+        regionGlobalCapture = False
+        configClient = get_client('config', n)
         response = configClient.describe_configuration_recorder_status()
         # Get recording status
         try:
             if not response['ConfigurationRecordersStatus'][0]['recording'] is True:
-                result = False
-                failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
-                offenders.append(str(n) + ":NotRecording")
+                regionOffenders.append(str(n) + ":NotRecording")
         except:
-            result = False
-            failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
-            offenders.append(str(n) + ":NotRecording")
+            regionOffenders.append(str(n) + ":NotRecording")
 
         # Verify that each region is capturing all events
         response = configClient.describe_configuration_recorders()
         try:
             if not response['ConfigurationRecorders'][0]['recordingGroup']['allSupported'] is True:
-                result = False
-                failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
-                offenders.append(str(n) + ":NotAllEvents")
+                regionOffenders.append(str(n) + ":NotAllEvents")
         except:
             pass  # This indicates that Config is disabled in the region and will be captured above.
 
         # Check if region is capturing global events. Fail is verified later since only one region needs to capture them.
         try:
             if response['ConfigurationRecorders'][0]['recordingGroup']['includeGlobalResourceTypes'] is True:
-                globalConfigCapture = True
+                regionGlobalCapture = True
         except:
             pass
 
@@ -988,18 +1208,23 @@ def control_2_5_ensure_config_all_regions(regions):
         response = configClient.describe_delivery_channel_status()
         try:
             if response['DeliveryChannelsStatus'][0]['configHistoryDeliveryInfo']['lastStatus'] != "SUCCESS":
-                result = False
-                failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
-                offenders.append(str(n) + ":S3orSNSDelivery")
+                regionOffenders.append(str(n) + ":S3orSNSDelivery")
         except:
             pass  # Will be captured by earlier rule
         try:
             if response['DeliveryChannelsStatus'][0]['configStreamDeliveryInfo']['lastStatus'] != "SUCCESS":
-                result = False
-                failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
-                offenders.append(str(n) + ":SNSDelivery")
+                regionOffenders.append(str(n) + ":SNSDelivery")
         except:
             pass  # Will be captured by earlier rule
+        return regionOffenders, regionGlobalCapture
+
+    for regionOffenders, regionGlobalCapture in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "Config not enabled in all regions, not capturing all/global events or delivery channel errors"
+            offenders.extend(regionOffenders)
+        if regionGlobalCapture:
+            globalConfigCapture = True
 
     # Verify that global events is captured by any region
     if globalConfigCapture is False:
@@ -1025,19 +1250,34 @@ def control_2_6_ensure_cloudtrail_bucket_logging(cloudtrails):
     control = "2.6"
     description = "Ensure S3 bucket access logging is enabled on the CloudTrail S3 bucket"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    buckets = get_trail_buckets(cloudtrails)
+    for m, n in cloudtrails.items():
         for o in n:
-            # it is possible to have a cloudtrail configured with a nonexistant bucket
-            try:
-                response = S3_CLIENT.get_bucket_logging(Bucket=o['S3BucketName'])
-            except:
+            if 'S3BucketName' not in o:
                 result = False
-                failReason = "Cloudtrail not configured to log to S3. "
+                if "Cloudtrail not" not in failReason:
+                    failReason = "Cloudtrail not configured to log to S3. " + failReason
                 offenders.append(str(o['TrailARN']))
-            try:
-                if response['LoggingEnabled']:
-                    pass
-            except:
+                continue
+            bucket = buckets[o['S3BucketName']]
+            # it is possible to have a cloudtrail configured with a nonexistant bucket, or one we may not read
+            if 'LoggingError' in bucket:
+                result = False
+                e = bucket['LoggingError']
+                if "AccessDenied" in str(e):
+                    offenders.append(str(o['TrailARN']) + ":AccessDenied")
+                    if "Missing" not in failReason:
+                        failReason = "Missing permissions to verify bucket logging. " + failReason
+                elif "NoSuchBucket" in str(e):
+                    offenders.append(str(o['TrailARN']) + ":NoBucket")
+                    if "Trailbucket" not in failReason:
+                        failReason = "Trailbucket doesn't exist. " + failReason
+                else:
+                    offenders.append(str(o['TrailARN']) + ":CannotVerify")
+                    if "Cannot" not in failReason:
+                        failReason = "Cannot verify bucket logging. " + failReason
+                continue
+            if not bucket['Logging'].get('LoggingEnabled'):
                 result = False
                 failReason = failReason + "CloudTrail S3 bucket without logging discovered"
                 offenders.append("Trail:" + str(o['TrailARN']) + " - S3Bucket:" + str(o['S3BucketName']))
@@ -1060,7 +1300,7 @@ def control_2_7_ensure_cloudtrail_encryption_kms(cloudtrails):
     control = "2.7"
     description = "Ensure CloudTrail logs are encrypted at rest using KMS CMKs"
     scored = True
-    for m, n in cloudtrails.iteritems():
+    for m, n in cloudtrails.items():
         for o in n:
             try:
                 if o['KmsKeyId']:
@@ -1085,22 +1325,33 @@ def control_2_8_ensure_kms_cmk_rotation(regions):
     control = "2.8"
     description = "Ensure rotation for customer created CMKs is enabled"
     scored = True
-    for n in regions:
-        kms_client = boto3.client('kms', region_name=n)
-        paginator = kms_client.get_paginator('list_keys')
-        response_iterator = paginator.paginate()
-        for page in response_iterator:
-            for n in page['Keys']:
-                try:
-                    rotationStatus = kms_client.get_key_rotation_status(KeyId=n['KeyId'])
-                    if rotationStatus['KeyRotationEnabled'] is False:
-                        keyDescription = kms_client.describe_key(KeyId=n['KeyId'])
-                        if "Default master key that protects my" not in str(keyDescription['KeyMetadata']['Description']):  # Ignore service keys
-                            result = False
-                            failReason = "KMS CMK rotation not enabled"
-                            offenders.append("Key:" + str(keyDescription['KeyMetadata']['Arn']))
-                except:
-                    pass  # Ignore keys without permission, for example ACM key
+
+    def region_check(n):
+        kms_client = get_client('kms', n)
+        managedKeys = get_aws_managed_kms_keys(n)
+
+        def key_check(m):
+            try:
+                if kms_client.get_key_rotation_status(KeyId=m['KeyId'])['KeyRotationEnabled']:
+                    return None
+                keyMetadata = get_kms_key(n, m['KeyId'])
+            except ClientError as e:
+                # Keys without permission, for example ACM key, or in a state without rotation
+                if e.response['Error']['Code'] in KMS_SKIPPED_ERRORS:
+                    return None
+                raise
+            if keyMetadata['KeyManager'] != 'CUSTOMER' or keyMetadata['KeyState'] == 'PendingDeletion':
+                return None
+            return "Key:" + str(keyMetadata['Arn'])
+
+        keys = [m for m in get_kms_keys(n) if m['KeyId'] not in managedKeys]
+        return [m for m in run_in_pool(KMS_KEY_WORKERS, keys, key_check) if m]
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "KMS CMK rotation not enabled"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1120,32 +1371,8 @@ def control_3_1_ensure_log_metric_filter_unauthorized_api_calls(cloudtrails):
     description = "Ensure log metric filter unauthorized api calls"
     scored = True
     failReason = "Incorrect log metric alerts for unauthorized_api_calls"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.errorCode\s*=\s*\"?\*UnauthorizedOperation(\"|\)|\s)", "\$\.errorCode\s*=\s*\"?AccessDenied\*(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.1" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1163,32 +1390,8 @@ def control_3_2_ensure_log_metric_filter_console_signin_no_mfa(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for Management Console sign-in without MFA"
     scored = True
     failReason = "Incorrect log metric alerts for management console signin without MFA"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?ConsoleLogin(\"|\)|\s)", "\$\.additionalEventData\.MFAUsed\s*\!=\s*\"?Yes"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.2" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1206,32 +1409,8 @@ def control_3_3_ensure_log_metric_filter_root_usage(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for root usage"
     scored = True
     failReason = "Incorrect log metric alerts for root usage"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.userIdentity\.type\s*=\s*\"?Root", "\$\.userIdentity\.invokedBy\s*NOT\s*EXISTS", "\$\.eventType\s*\!=\s*\"?AwsServiceEvent(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.3" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1249,32 +1428,8 @@ def control_3_4_ensure_log_metric_iam_policy_change(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for IAM changes"
     scored = True
     failReason = "Incorrect log metric alerts for IAM policy changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?DeleteGroupPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteRolePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteUserPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutGroupPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutRolePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutUserPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreatePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeletePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreatePolicyVersion(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeletePolicyVersion(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AttachRolePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DetachRolePolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AttachUserPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DetachUserPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AttachGroupPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DetachGroupPolicy(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.4" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1292,32 +1447,8 @@ def control_3_5_ensure_log_metric_cloudtrail_configuration_changes(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for CloudTrail configuration changes"
     scored = True
     failReason = "Incorrect log metric alerts for CloudTrail configuration changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?CreateTrail(\"|\)|\s)", "\$\.eventName\s*=\s*\"?UpdateTrail(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteTrail(\"|\)|\s)", "\$\.eventName\s*=\s*\"?StartLogging(\"|\)|\s)", "\$\.eventName\s*=\s*\"?StopLogging(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.5" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1335,32 +1466,8 @@ def control_3_6_ensure_log_metric_console_auth_failures(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for console auth failures"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for console auth failures"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?ConsoleLogin(\"|\)|\s)", "\$\.errorMessage\s*=\s*\"?Failed authentication(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.6" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1378,32 +1485,8 @@ def control_3_7_ensure_log_metric_disabling_scheduled_delete_of_kms_cmk(cloudtra
     description = "Ensure a log metric filter and alarm exist for disabling or scheduling deletion of KMS CMK"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for disabling or scheduling deletion of KMS CMK"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventSource\s*=\s*\"?kms\.amazonaws\.com(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DisableKey(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ScheduleKeyDeletion(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.7" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1421,32 +1504,8 @@ def control_3_8_ensure_log_metric_s3_bucket_policy_changes(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for S3 bucket policy changes"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for S3 bucket policy changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventSource\s*=\s*\"?s3\.amazonaws\.com(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutBucketAcl(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutBucketPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutBucketCors(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutBucketLifecycle(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutBucketReplication(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteBucketPolicy(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteBucketCors(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteBucketLifecycle(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteBucketReplication(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.8" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1464,32 +1523,8 @@ def control_3_9_ensure_log_metric_config_configuration_changes(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for for AWS Config configuration changes"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for for AWS Config configuration changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventSource\s*=\s*\"?config\.amazonaws\.com(\"|\)|\s)", "\$\.eventName\s*=\s*\"?StopConfigurationRecorder(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteDeliveryChannel(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutDeliveryChannel(\"|\)|\s)", "\$\.eventName\s*=\s*\"?PutConfigurationRecorder(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.9" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1507,32 +1542,8 @@ def control_3_10_ensure_log_metric_security_group_changes(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for security group changes"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for security group changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?AuthorizeSecurityGroupIngress(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AuthorizeSecurityGroupEgress(\"|\)|\s)", "\$\.eventName\s*=\s*\"?RevokeSecurityGroupIngress(\"|\)|\s)", "\$\.eventName\s*=\s*\"?RevokeSecurityGroupEgress(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreateSecurityGroup(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteSecurityGroup(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.10" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1550,32 +1561,8 @@ def control_3_11_ensure_log_metric_nacl(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for changes to Network Access Control Lists (NACL)"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for changes to Network Access Control Lists (NACL)"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?CreateNetworkAcl(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreateNetworkAclEntry(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteNetworkAcl(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteNetworkAclEntry(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ReplaceNetworkAclEntry(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ReplaceNetworkAclAssociation(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.11" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1593,32 +1580,8 @@ def control_3_12_ensure_log_metric_changes_to_network_gateways(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for changes to network gateways"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for changes to network gateways"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?CreateCustomerGateway(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteCustomerGateway(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AttachInternetGateway(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreateInternetGateway(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteInternetGateway(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DetachInternetGateway(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.12" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1636,32 +1599,8 @@ def control_3_13_ensure_log_metric_changes_to_route_tables(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for route table changes"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for route table changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?CreateRoute(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreateRouteTable(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ReplaceRoute(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ReplaceRouteTableAssociation(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteRouteTable(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteRoute(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DisassociateRouteTable(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.13" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1679,32 +1618,8 @@ def control_3_14_ensure_log_metric_changes_to_vpc(cloudtrails):
     description = "Ensure a log metric filter and alarm exist for VPC changes"
     scored = True
     failReason = "Ensure a log metric filter and alarm exist for VPC changes"
-    for m, n in cloudtrails.iteritems():
-        for o in n:
-            try:
-                if o['CloudWatchLogsLogGroupArn']:
-                    group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
-                    client = boto3.client('logs', region_name=m)
-                    filters = client.describe_metric_filters(
-                        logGroupName=group
-                    )
-                    for p in filters['metricFilters']:
-                        patterns = ["\$\.eventName\s*=\s*\"?CreateVpc(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteVpc(\"|\)|\s)", "\$\.eventName\s*=\s*\"?ModifyVpcAttribute(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AcceptVpcPeeringConnection(\"|\)|\s)", "\$\.eventName\s*=\s*\"?CreateVpcPeeringConnection(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DeleteVpcPeeringConnection(\"|\)|\s)", "\$\.eventName\s*=\s*\"?RejectVpcPeeringConnection(\"|\)|\s)", "\$\.eventName\s*=\s*\"?AttachClassicLinkVpc(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DetachClassicLinkVpc(\"|\)|\s)", "\$\.eventName\s*=\s*\"?DisableVpcClassicLink(\"|\)|\s)", "\$\.eventName\s*=\s*\"?EnableVpcClassicLink(\"|\)|\s)"]
-                        if find_in_string(patterns, str(p['filterPattern'])):
-                            cwclient = boto3.client('cloudwatch', region_name=m)
-                            response = cwclient.describe_alarms_for_metric(
-                                MetricName=p['metricTransformations'][0]['metricName'],
-                                Namespace=p['metricTransformations'][0]['metricNamespace']
-                            )
-                            snsClient = boto3.client('sns', region_name=m)
-                            subscribers = snsClient.list_subscriptions_by_topic(
-                                TopicArn=response['MetricAlarms'][0]['AlarmActions'][0]
-                                #  Pagination not used since only 1 subscriber required
-                            )
-                            if not len(subscribers['Subscriptions']) == 0:
-                                result = True
-            except:
-                pass
+    if "3.14" in get_metric_filter_index(cloudtrails)['AlarmedControls']:
+        result = True
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1740,22 +1655,25 @@ def control_4_1_ensure_ssh_not_open_to_world(regions):
     control = "4.1"
     description = "Ensure no security groups allow ingress from 0.0.0.0/0 to port 22"
     scored = True
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        response = client.describe_security_groups()
-        for m in response['SecurityGroups']:
+
+    def region_check(n):
+        regionOffenders = []
+        for m in get_security_groups(n):
             if "0.0.0.0/0" in str(m['IpPermissions']):
                 for o in m['IpPermissions']:
                     try:
                         if int(o['FromPort']) <= 22 <= int(o['ToPort']) and '0.0.0.0/0' in str(o['IpRanges']):
-                            result = False
-                            failReason = "Found Security Group with port 22 open to the world (0.0.0.0/0)"
-                            offenders.append(str(m['GroupId']))
+                            regionOffenders.append(str(m['GroupId']))
                     except:
                         if str(o['IpProtocol']) == "-1" and '0.0.0.0/0' in str(o['IpRanges']):
-                            result = False
-                            failReason = "Found Security Group with port 22 open to the world (0.0.0.0/0)"
-                            offenders.append(str(n) + " : " + str(m['GroupId']))
+                            regionOffenders.append(str(n) + " : " + str(m['GroupId']))
+        return regionOffenders
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "Found Security Group with port 22 open to the world (0.0.0.0/0)"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1772,22 +1690,25 @@ def control_4_2_ensure_rdp_not_open_to_world(regions):
     control = "4.2"
     description = "Ensure no security groups allow ingress from 0.0.0.0/0 to port 3389"
     scored = True
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        response = client.describe_security_groups()
-        for m in response['SecurityGroups']:
+
+    def region_check(n):
+        regionOffenders = []
+        for m in get_security_groups(n):
             if "0.0.0.0/0" in str(m['IpPermissions']):
                 for o in m['IpPermissions']:
                     try:
                         if int(o['FromPort']) <= 3389 <= int(o['ToPort']) and '0.0.0.0/0' in str(o['IpRanges']):
-                            result = False
-                            failReason = "Found Security Group with port 3389 open to the world (0.0.0.0/0)"
-                            offenders.append(str(m['GroupId']))
+                            regionOffenders.append(str(m['GroupId']))
                     except:
                         if str(o['IpProtocol']) == "-1" and '0.0.0.0/0' in str(o['IpRanges']):
-                            result = False
-                            failReason = "Found Security Group with port 3389 open to the world (0.0.0.0/0)"
-                            offenders.append(str(n) + " : " + str(m['GroupId']))
+                            regionOffenders.append(str(n) + " : " + str(m['GroupId']))
+        return regionOffenders
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "Found Security Group with port 3389 open to the world (0.0.0.0/0)"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1804,30 +1725,20 @@ def control_4_3_ensure_flow_logs_enabled_on_all_vpc(regions):
     control = "4.3"
     description = "Ensure VPC flow logging is enabled in all VPCs"
     scored = True
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        flowlogs = client.describe_flow_logs(
-            #  No paginator support in boto atm.
-        )
-        activeLogs = []
-        for m in flowlogs['FlowLogs']:
-            if "vpc-" in str(m['ResourceId']):
-                activeLogs.append(m['ResourceId'])
-        vpcs = client.describe_vpcs(
-            Filters=[
-                {
-                    'Name': 'state',
-                    'Values': [
-                        'available',
-                    ]
-                },
-            ]
-        )
-        for m in vpcs['Vpcs']:
-            if not str(m['VpcId']) in str(activeLogs):
-                result = False
-                failReason = "VPC without active VPC Flow Logs found"
-                offenders.append(str(n) + " : " + str(m['VpcId']))
+
+    def region_check(n):
+        regionOffenders = []
+        inventory = get_vpc_flow_logs(n)
+        for m in inventory['Vpcs']:
+            if m['VpcId'] not in inventory['FlowLogVpcIds']:
+                regionOffenders.append(str(n) + " : " + str(m['VpcId']))
+        return regionOffenders
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "VPC without active VPC Flow Logs found"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1844,23 +1755,21 @@ def control_4_4_ensure_default_security_groups_restricts_traffic(regions):
     control = "4.4"
     description = "Ensure the default security group of every VPC restricts all traffic"
     scored = True
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        response = client.describe_security_groups(
-            Filters=[
-                {
-                    'Name': 'group-name',
-                    'Values': [
-                        'default',
-                    ]
-                },
-            ]
-        )
-        for m in response['SecurityGroups']:
+
+    def region_check(n):
+        regionOffenders = []
+        for m in get_security_groups(n):
+            if m['GroupName'] != 'default':
+                continue
             if not (len(m['IpPermissions']) + len(m['IpPermissionsEgress'])) == 0:
-                result = False
-                failReason = "Default security groups with ingress or egress rules discovered"
-                offenders.append(str(n) + " : " + str(m['GroupId']))
+                regionOffenders.append(str(n) + " : " + str(m['GroupId']))
+        return regionOffenders
+
+    for regionOffenders in run_in_regions(regions, region_check):
+        if regionOffenders:
+            result = False
+            failReason = "Default security groups with ingress or egress rules discovered"
+            offenders.extend(regionOffenders)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
@@ -1868,6 +1777,9 @@ def control_4_4_ensure_default_security_groups_restricts_traffic(regions):
 def control_4_5_ensure_route_tables_are_least_access(regions):
     """Summary
 
+    Args:
+        regions (list): Region names to evaluate
+
     Returns:
         TYPE: Description
     """
@@ -1877,98 +1789,1214 @@ def control_4_5_ensure_route_tables_are_least_access(regions):
     control = "4.5"
     description = "Ensure routing tables for VPC peering are least access"
     scored = False
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        response = client.describe_route_tables()
-        for m in response['RouteTables']:
+
+    def region_check(n):
+        broadRoutes = []
+        overlappingRoutes = []
+        routes = []
+        for m in get_route_tables(n):
             for o in m['Routes']:
-                try:
-                    if o['VpcPeeringConnectionId']:
-                        if int(str(o['DestinationCidrBlock']).split("/", 1)[1]) < 24:
-                            result = False
-                            failReason = "Large CIDR block routed to peer discovered, please investigate"
-                            offenders.append(str(n) + " : " + str(m['RouteTableId']))
-                except:
-                    pass
+                if 'VpcPeeringConnectionId' not in o:
+                    continue
+                destination = o.get('DestinationCidrBlock', o.get('DestinationIpv6CidrBlock'))
+                prefix = parse_cidr(destination)
+                if prefix is None:
+                    continue  # Prefix list destinations
+                routes.append((prefix, m.get('VpcId'), m['RouteTableId'], o['VpcPeeringConnectionId'], destination))
+                if prefix[2] < (CONTROL_4_5_IPV4_PREFIX if prefix[0] == 4 else CONTROL_4_5_IPV6_PREFIX):
+                    broadRoutes.append(str(n) + " : " + str(m['RouteTableId']))
+        # Index the peering routes by prefix, broadest first, so every route finds the routes
+        # containing it by looking up its own prefix and all shorter ones. A containing route
+        # overlaps when it is in the same table, or in another table of the VPC with another peer.
+        index = {}
+        for prefix, vpcId, routeTableId, peeringId, destination in sorted(routes, key=lambda r: r[0][2]):
+            version, network, length = prefix
+            bits = 32 if version == 4 else 128
+            for i in range(length + 1):
+                for other in index.get((version, i, network >> (bits - i)), []):
+                    if other[1] == routeTableId or (other[0] == vpcId and other[2] != peeringId):
+                        overlappingRoutes.append(str(n) + " : " + str(routeTableId) + " : " + str(destination) + " overlaps " + str(other[1]) + " : " + str(other[3]))
+            index.setdefault((version, length, network >> (bits - length)), []).append((vpcId, routeTableId, peeringId, destination))
+        return broadRoutes, overlappingRoutes
+
+    for broadRoutes, overlappingRoutes in run_in_regions(regions, region_check):
+        if overlappingRoutes:
+            result = False
+            failReason = "Overlapping routes to peers discovered, please investigate"
+            offenders.extend(overlappingRoutes)
+        if broadRoutes:
+            result = False
+            failReason = "Large CIDR block routed to peer discovered, please investigate"
+            offenders.extend(broadRoutes)
     return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
 
 
-# 4.5 Ensure routing tables for VPC peering are "least access" (Not Scored)
-def control_4_5_ensure_route_tables_are_least_access(regions):
-    """Summary
+# --- Central functions ---
+
+def get_default_session():
+    """Get the boto3 default session, created from the default profile on first use
 
     Returns:
-        TYPE: Description
+        boto3.session.Session: Session used for all clients of the current account
     """
-    result = True
-    failReason = ""
-    offenders = []
-    control = "4.5"
-    description = "Ensure routing tables for VPC peering are least access"
-    scored = False
-    for n in regions:
-        client = boto3.client('ec2', region_name=n)
-        response = client.describe_route_tables()
-        for m in response['RouteTables']:
-            for o in m['Routes']:
-                try:
-                    if o['VpcPeeringConnectionId']:
-                        if int(str(o['DestinationCidrBlock']).split("/", 1)[1]) < 24:
-                            result = False
-                            failReason = "Large CIDR block routed to peer discovered, please investigate"
-                            offenders.append(str(n) + " : " + str(m['RouteTableId']))
-                except:
-                    pass
-    return {'Result': result, 'failReason': failReason, 'Offenders': offenders, 'ScoredControl': scored, 'Description': description, 'ControlId': control}
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    return boto3.DEFAULT_SESSION
 
 
-# --- Central functions ---
+def get_profile_name(session):
+    """Get the profile a session was created with
 
-def get_cred_report():
-    """Summary
+    Args:
+        session (boto3.session.Session): Session
 
     Returns:
-        TYPE: Description
+        str: Profile name, None for the implicit default profile of a session without a config file
     """
-    x = 0
-    status = ""
-    while IAM_CLIENT.generate_credential_report()['State'] != "COMPLETE":
-        time.sleep(2)
-        x += 1
-        # If no credentail report is delivered within this time fail the check.
-        if x > 10:
-            status = "Fail: rootUse - no CredentialReport available."
-            break
-    if "Fail" in status:
-        return status
-    response = IAM_CLIENT.get_credential_report()
-    report = []
-    reader = csv.DictReader(response['Content'].splitlines(), delimiter=',')
-    for row in reader:
-        report.append(row)
+    return session.profile_name if session.profile_name in session.available_profiles else None
 
-    # Verify if root key's never been used, if so add N/A
-    try:
-        if report[0]['access_key_1_last_used_date']:
-            pass
-    except:
-        report[0]['access_key_1_last_used_date'] = "N/A"
-    try:
-        if report[0]['access_key_2_last_used_date']:
-            pass
-    except:
-        report[0]['access_key_2_last_used_date'] = "N/A"
-    return report
 
+def get_client(service, region=None):
+    """Get the shared client for a service and region, created once per session
 
-def get_account_password_policy():
-    """Check if a IAM password policy exists, if not return false
+    Clients are thread safe once created and are reused by all controls and region workers.
+
+    Args:
+        service (str): AWS service name
+        region (str, optional): Region name, default region of the session if omitted
 
     Returns:
-        Account IAM password policy or False
+        botocore.client.BaseClient: Client for the service in the region
     """
-    try:
-        response = IAM_CLIENT.get_account_password_policy()
+    session = get_default_session()
+    key = (session, service, region)
+    with CLIENT_LOCK:
+        client = CLIENTS.get(key)
+        if client is None:
+            client = session.client(service, region_name=region, config=CLIENT_CONFIG)
+            if RECORD_DIR or REPLAY_DIR:
+                attach_recorder(client)
+            if CONTROL_METRICS:
+                attach_metrics(client)
+            CLIENTS[key] = client
+        return client
+
+
+def attach_recorder(client):
+    """Record the responses of a client to RECORD_DIR, or replay them from REPLAY_DIR
+
+    Calls are keyed by scope, service, region, operation and a fingerprint of the parameters.
+
+    Args:
+        client (botocore.client.BaseClient): Client to record or replay
+    """
+    service = client.meta.service_model.service_name
+    region = client.meta.region_name
+
+    def call_key(params, context, model, **kwargs):
+        # Uploaded content differs between runs, so it is not part of the key
+        context['recordOperation'] = "\t".join([RECORD_SCOPE, service, str(region), model.name])
+        context['recordParams'] = dict((k, v) for k, v in params.items() if k != 'Body')
+        context['recordKey'] = context['recordOperation'] + "\t" + fingerprint(context['recordParams'])
+        context['recordStart'] = time.time()
+
+    client.meta.events.register('provide-client-params', call_key)
+    if REPLAY_DIR:
+        client.meta.events.register('before-call', replay_call)
+    elif RECORD_DIR:
+        # Record before botocore's own after-call handlers (IAM policy decoding, ...) change the response,
+        # they run again on replayed responses
+        client.meta.events.register_first('after-call.' + client.meta.service_model.service_id.hyphenize(), record_call)
+
+
+def new_metrics():
+    """Empty metrics of a control, or of the API calls made outside of controls
+
+    Returns:
+        dict: Counters, with a breakdown per service and operation in Services
+    """
+    return {'WallTime': 0.0, 'ApiCalls': 0, 'Retries': 0, 'Throttles': 0, 'BytesReceived': 0, 'Pages': 0, 'Services': {}}
+
+
+def attach_metrics(client):
+    """Count the API calls of a client into the metrics of the control running in the calling thread
+
+    Calls made outside of a control are counted in RUN_METRICS. Calls to operations that can be
+    paginated are counted as pages.
+
+    Args:
+        client (botocore.client.BaseClient): Client to measure
+    """
+    service = client.meta.service_model.service_name
+    paginated = set(n for m, n in client.meta.method_to_api_mapping.items() if client.can_paginate(m))
+
+    def count_attempt(request_dict, response, **kwargs):
+        # Called by botocore's retry handler after every attempt, not for responses served by a before-call handler
+        context = request_dict['context']
+        context['metricsAttempts'] = context.get('metricsAttempts', 0) + 1
+        if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERRORS:
+            context['metricsThrottles'] = context.get('metricsThrottles', 0) + 1
+
+    def count_call(http_response, parsed, model, context, **kwargs):
+        metrics = getattr(METRICS_CONTEXT, 'metrics', None)
+        if metrics is None:
+            metrics = RUN_METRICS
+        if 'metricsAttempts' in context:
+            throttles = context.get('metricsThrottles', 0)
+        else:
+            throttles = int(parsed.get('Error', {}).get('Code') in THROTTLING_ERRORS)
+        length = http_response.headers.get('content-length')
+        if length is None and not model.has_streaming_output:
+            try:
+                length = len(http_response.content)
+            except Exception:
+                length = 0
+        with METRICS_LOCK:
+            if not metrics:
+                metrics.update(new_metrics())
+            operation = metrics['Services'].setdefault(service, {}).setdefault(model.name, {'ApiCalls': 0, 'Retries': 0, 'Throttles': 0, 'BytesReceived': 0, 'Pages': 0})
+            for entry in (metrics, operation):
+                entry['ApiCalls'] += 1
+                entry['Retries'] += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+                entry['Throttles'] += throttles
+                entry['BytesReceived'] += int(length or 0)
+                entry['Pages'] += int(model.name in paginated)
+
+    client.meta.events.register('needs-retry', count_attempt)
+    client.meta.events.register('after-call', count_call)
+
+
+def record_call(http_response, parsed, context, **kwargs):
+    """Store a response, after-call event handler installed by attach_recorder()
+    """
+    if 'recordKey' not in context:
+        return
+    response = dict(parsed)
+    if isinstance(parsed.get('Body'), StreamingBody):
+        # Streamed content can only be read once, hand the caller a copy
+        response['Body'] = parsed['Body'].read()
+        parsed['Body'] = StreamingBody(io.BytesIO(response['Body']), len(response['Body']))
+    entry = {'Status': http_response.status_code, 'Latency': time.time() - context['recordStart'], 'Response': encode_recorded(response)}
+    with RECORDING_LOCK:
+        RECORDING.setdefault(context['recordKey'], []).append(entry)
+
+
+def replay_call(context, **kwargs):
+    """Serve a recorded response instead of calling AWS, before-call event handler installed by attach_recorder()
+
+    Repeated calls get the recorded responses in order, the last one is repeated. Calls of
+    REPLAY_FALLBACK_OPERATIONS get the responses of their operation when their parameters differ.
+
+    Returns:
+        tuple: HTTP response and parsed response, which skip the call to AWS
+    """
+    with RECORDING_LOCK:
+        if not REPLAY:
+            REPLAY.update(read_recordings(REPLAY_DIR))
+        key = context['recordKey']
+        if key not in REPLAY and context['recordOperation'].rsplit("\t", 1)[1] in REPLAY_FALLBACK_OPERATIONS:
+            key = context['recordOperation']
+        if key not in REPLAY:
+            raise RuntimeError("No recording for " + " ".join(n for n in context['recordOperation'].split("\t") if n) + " " + json.dumps(context['recordParams'], sort_keys=True, default=str))
+        position = REPLAY_POSITIONS.get(key, 0)
+        REPLAY_POSITIONS[key] = position + 1
+        entry = REPLAY[key][min(position, len(REPLAY[key]) - 1)]
+    if REPLAY_LATENCY == "recorded":
+        time.sleep(entry['Latency'])
+    elif REPLAY_LATENCY:
+        time.sleep(float(REPLAY_LATENCY))
+    parsed = decode_recorded(entry['Response'])
+    if isinstance(parsed.get('Body'), bytes):
+        parsed['Body'] = StreamingBody(io.BytesIO(parsed['Body']), len(parsed['Body']))
+    return AWSResponse(None, entry['Status'], {}, None), parsed
+
+
+def encode_recorded(value):
+    """Convert a parsed response into JSON serializable data, dates and bytes are tagged
+
+    Args:
+        value: Parsed response or part of it
+
+    Returns:
+        JSON serializable value
+    """
+    if isinstance(value, dict):
+        return dict((k, encode_recorded(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [encode_recorded(n) for n in value]
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def decode_recorded(value):
+    """Reverse encode_recorded()
+
+    Args:
+        value: Value as stored by encode_recorded()
+
+    Returns:
+        Parsed response or part of it
+    """
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            return parse_timestamp(value['__datetime__'])
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return dict((k, decode_recorded(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [decode_recorded(n) for n in value]
+    return value
+
+
+def save_recording():
+    """Write the responses recorded by this process to RECORD_DIR as recording-<pid>.json.gz
+
+    Responses contain account data like the credential report, so the file is readable by the current user only.
+    """
+    if not RECORD_DIR:
+        return
+    if not os.path.isdir(RECORD_DIR):
+        os.makedirs(RECORD_DIR, 0o700)
+    with RECORDING_LOCK:
+        content = json.dumps(RECORDING, sort_keys=True).encode('utf-8')
+    fd = os.open(os.path.join(RECORD_DIR, "recording-" + str(os.getpid()) + ".json.gz"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as g:
+            g.write(content)
+
+
+def read_recordings(directory):
+    """Read and merge all recordings in a directory
+
+    Args:
+        directory (str): Directory with recording-<pid>.json.gz files
+
+    Returns:
+        dict: Recorded responses per call key, and per operation (the key without the parameters)
+            for REPLAY_FALLBACK_OPERATIONS
+    """
+    recordings = dict()
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("recording-") and name.endswith(".json.gz"):
+            with gzip.open(os.path.join(directory, name), 'rb') as f:
+                for key, entries in sorted(json.loads(f.read().decode('utf-8')).items()):
+                    recordings.setdefault(key, []).extend(entries)
+                    operation = key.rsplit("\t", 1)[0]
+                    if operation.rsplit("\t", 1)[1] in REPLAY_FALLBACK_OPERATIONS:
+                        recordings.setdefault(operation, []).extend(entries)
+    return recordings
+
+
+def run_cached(key, fetch):
+    """Return the value cached for key during this run, calling fetch once to create it
+
+    Concurrent callers asking for the same key wait for the first fetch instead of repeating it.
+
+    Args:
+        key (tuple): Cache key, for example ('security_groups', region)
+        fetch (function): Called without arguments to create the value
+
+    Returns:
+        The cached value
+    """
+    with RUN_CACHE_LOCK:
+        if key in RUN_CACHE:
+            return RUN_CACHE[key]
+        keyLock = RUN_CACHE_KEY_LOCKS.setdefault(key, threading.Lock())
+    with keyLock:
+        with RUN_CACHE_LOCK:
+            if key in RUN_CACHE:
+                return RUN_CACHE[key]
+        value = fetch()
+        with RUN_CACHE_LOCK:
+            RUN_CACHE[key] = value
+        return value
+
+
+def reset_run_cache():
+    """Drop all data cached by run_cached(), called at the start of every run
+    """
+    with RUN_CACHE_LOCK:
+        RUN_CACHE.clear()
+        RUN_CACHE_KEY_LOCKS.clear()
+
+
+def paginate_all(client, operation, key, **kwargs):
+    """Collect every item of a paginated list operation
+
+    Args:
+        client (botocore.client.BaseClient): Client to call
+        operation (str): Paginated operation name, for example describe_security_groups
+        key (str): Response key holding the items
+        **kwargs: Parameters passed to the operation
+
+    Returns:
+        list: Items from all pages
+    """
+    pagedResult = []
+    for page in client.get_paginator(operation).paginate(**kwargs):
+        pagedResult.extend(page[key])
+    return pagedResult
+
+
+def get_security_groups(region):
+    """Security groups of a region, fetched once per run and shared by 4.1, 4.2 and 4.4
+
+    Args:
+        region (str): Region name
+
+    Returns:
+        list: Security groups of the region
+    """
+    return run_cached(('security_groups', region), lambda: paginate_all(get_client('ec2', region), 'describe_security_groups', 'SecurityGroups'))
+
+
+def get_vpc_flow_logs(region):
+    """Available VPCs of a region and the VPCs among them with flow logs, fetched once per run
+
+    Args:
+        region (str): Region name
+
+    Returns:
+        dict: Vpcs list and FlowLogVpcIds set for the region
+    """
+    def fetch():
+        client = get_client('ec2', region)
+        vpcs = paginate_all(client, 'describe_vpcs', 'Vpcs', Filters=[{'Name': 'state', 'Values': ['available']}])
+        # describe_flow_logs has no resource type filter, so only flow logs of the listed VPCs are requested
+        flowLogVpcIds = set()
+        vpcIds = [m['VpcId'] for m in vpcs]
+        for i in range(0, len(vpcIds), FLOW_LOG_FILTER_CHUNK):
+            flowLogs = paginate_all(client, 'describe_flow_logs', 'FlowLogs', Filters=[{'Name': 'resource-id', 'Values': vpcIds[i:i + FLOW_LOG_FILTER_CHUNK]}])
+            flowLogVpcIds.update(m['ResourceId'] for m in flowLogs)
+        return {'Vpcs': vpcs, 'FlowLogVpcIds': flowLogVpcIds}
+    return run_cached(('vpc_flow_logs', region), fetch)
+
+
+def get_route_tables(region):
+    """Route tables of a region, fetched once per run
+
+    Args:
+        region (str): Region name
+
+    Returns:
+        list: Route tables of the region
+    """
+    return run_cached(('route_tables', region), lambda: paginate_all(get_client('ec2', region), 'describe_route_tables', 'RouteTables'))
+
+
+def parse_cidr(cidr):
+    """Parse an IPv4 or IPv6 CIDR block
+
+    Args:
+        cidr (str): CIDR block, for example 10.0.0.0/16 or 2600:1f18::/56
+
+    Returns:
+        tuple: IP version (4 or 6), network address as integer and prefix length, None if not a CIDR block
+    """
+    try:
+        address, length = str(cidr).split("/", 1)
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+        network = int(binascii.hexlify(socket.inet_pton(family, address)), 16)
+        return (6 if family == socket.AF_INET6 else 4, network, int(length))
+    except (ValueError, socket.error):
+        return None
+
+
+def get_aws_managed_kms_keys(region):
+    """Find the AWS managed KMS keys in a region from their alias/aws/ aliases
+
+    Args:
+        region (str): Region name
+
+    Returns:
+        set: Key ids of the AWS managed keys
+    """
+    def fetch():
+        aliases = paginate_all(get_client('kms', region), 'list_aliases', 'Aliases')
+        return set(m['TargetKeyId'] for m in aliases if m['AliasName'].startswith('alias/aws/') and 'TargetKeyId' in m)
+    return run_cached(('kms_managed_keys', region), fetch)
+
+
+def get_kms_key(region, keyId):
+    """Get the metadata of a KMS key, describe_key is called once per key and run
+
+    Args:
+        region (str): Region name
+        keyId (str): Key id
+
+    Returns:
+        dict: KeyMetadata of the key
+    """
+    return run_cached(('kms_key', region, keyId), lambda: get_client('kms', region).describe_key(KeyId=keyId)['KeyMetadata'])
+
+
+def get_kms_keys(region):
+    """List the KMS keys of a region, list_keys is called once per region and run
+
+    Args:
+        region (str): Region name
+
+    Returns:
+        list: KeyId and KeyArn of every key
+    """
+    return run_cached(('kms_keys', region), lambda: paginate_all(get_client('kms', region), 'list_keys', 'Keys'))
+
+
+def get_metric_filters(region, group):
+    """Get the metric filters of a log group, fetched once per log group and run
+
+    Args:
+        region (str): Region name
+        group (str): Log group name
+
+    Returns:
+        list: Metric filters of the log group, empty if they cannot be read
+    """
+    def fetch():
+        try:
+            return paginate_all(get_client('logs', region), 'describe_metric_filters', 'metricFilters', logGroupName=group)
+        except:
+            return []
+    return run_cached(('metric_filters', region, group), fetch)
+
+
+def get_metric_filter_index(cloudtrails):
+    """Index the metric filters, alarms and alarm subscribers of all trail log groups, built once per run
+
+    Every metric filter is matched against the patterns of all section 3 controls in one pass.
+    Alarms and subscriptions are only looked up for filters matching at least one control,
+    and only once per metric and per topic.
+
+    Args:
+        cloudtrails (dict): Trails per region as returned by get_cloudtrails()
+
+    Returns:
+        dict: LogGroupFilters per (region, log group), MetricAlarms per (region, namespace, metric),
+            TopicSubscriptions per (region, topic) and AlarmedControls, the set of control ids
+            with a matching metric filter that has an alarm with subscribers
+    """
+    def region_index(region):
+        index = {'LogGroupFilters': {}, 'MetricAlarms': {}, 'TopicSubscriptions': {}, 'AlarmedControls': set()}
+        for o in cloudtrails[region]:
+            try:
+                group = re.search('log-group:(.+?):', o['CloudWatchLogsLogGroupArn']).group(1)
+            except:
+                continue  # Trail not integrated with CloudWatch Logs
+            if (region, group) in index['LogGroupFilters']:
+                continue
+            filters = get_metric_filters(region, group)
+            index['LogGroupFilters'][(region, group)] = filters
+            for p in filters:
+                matched = match_metric_filter_controls(str(p['filterPattern']))
+                if not matched or matched <= index['AlarmedControls']:
+                    continue
+                try:
+                    metric = (region, p['metricTransformations'][0]['metricNamespace'], p['metricTransformations'][0]['metricName'])
+                    if metric not in index['MetricAlarms']:
+                        index['MetricAlarms'][metric] = get_client('cloudwatch', region).describe_alarms_for_metric(
+                            MetricName=metric[2],
+                            Namespace=metric[1]
+                        )['MetricAlarms']
+                    topic = (region, index['MetricAlarms'][metric][0]['AlarmActions'][0])
+                    if topic not in index['TopicSubscriptions']:
+                        index['TopicSubscriptions'][topic] = get_client('sns', region).list_subscriptions_by_topic(
+                            TopicArn=topic[1]
+                            #  Pagination not used since only 1 subscriber required
+                        )['Subscriptions']
+                    if not len(index['TopicSubscriptions'][topic]) == 0:
+                        index['AlarmedControls'] |= matched
+                except:
+                    pass  # No alarm, alarm action or readable topic for the metric
+        return index
+
+    def build():
+        index = {'LogGroupFilters': {}, 'MetricAlarms': {}, 'TopicSubscriptions': {}, 'AlarmedControls': set()}
+        for regionIndex in run_in_regions(sorted(cloudtrails), region_index):
+            for key in ('LogGroupFilters', 'MetricAlarms', 'TopicSubscriptions'):
+                index[key].update(regionIndex[key])
+            index['AlarmedControls'] |= regionIndex['AlarmedControls']
+        return index
+    return run_cached(('metric_filter_index',), build)
+
+
+def get_initial_access_key_id(user, created):
+    """Find the id of an active access key created at the given time
+
+    Args:
+        user (str): IAM user name
+        created (int): Creation time in epoch seconds
+
+    Returns:
+        str: Access key id, None if the key no longer exists
+    """
+    try:
+        keys = paginate_all(get_client('iam'), 'list_access_keys', 'AccessKeyMetadata', UserName=user)
+    except Exception as e:
+        # The user may have been deleted after the credential report was generated
+        if "NoSuchEntity" not in str(e):
+            raise
+        return None
+    for m in keys:
+        if m['Status'] == 'Active' and calendar.timegm(m['CreateDate'].utctimetuple()) == created:
+            return m['AccessKeyId']
+    return None
+
+
+def run_in_pool(workers, items, check):
+    """Run check for all items using at most workers threads
+
+    Args:
+        workers (int): Maximum number of threads
+        items (list): Items to check
+        check (function): Called with each item
+
+    Returns:
+        list: Return values of check, in the order of items
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [check(n) for n in items]
+    metrics = getattr(METRICS_CONTEXT, 'metrics', None)
+    if metrics is not None:
+        # Count the API calls of the workers into the metrics of the calling control
+        measuredCheck = check
+
+        def check(item):
+            METRICS_CONTEXT.metrics = metrics
+            try:
+                return measuredCheck(item)
+            finally:
+                METRICS_CONTEXT.metrics = None
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(check, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_in_regions(regions, regionCheck):
+    """Run a per-region check for all regions using REGION_WORKERS threads
+
+    Args:
+        regions (list): Region names to evaluate
+        regionCheck (function): Called with a region name, returns the findings for that region
+
+    Returns:
+        list: One regionCheck result per region, in the same order as regions
+    """
+    return run_in_pool(REGION_WORKERS, regions, regionCheck)
+
+
+class CredentialReport(object):
+    """IAM credential report stored per column
+
+    Date columns are parsed once into epoch seconds, kept in a NumPy datetime64 array when NumPy
+    is available and in an array of longs otherwise. Other columns are kept as lists of interned
+    strings. Rows are still available as report[i]['column'] like the csv.DictReader rows used
+    by earlier versions of this script.
+    """
+
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+    DATE_SUFFIXES = ('_time', '_last_used', '_last_used_date', '_last_changed', '_next_rotation', '_last_rotated')
+
+    def __init__(self, content):
+        """Parse the CSV content of an IAM credential report
+
+        Args:
+            content (str): CSV content as returned by get_credential_report
+        """
+        if not isinstance(content, str):
+            content = content.decode('utf-8')
+        self.fingerprint = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        rows = csv.reader(content.splitlines(), delimiter=',')
+        self.columns = next(rows)
+        # Values found in date columns that are not dates (N/A, no_information, ...), stored as negative epochs
+        self.noDate = []
+        values = [[] for _ in self.columns]
+        for row in rows:
+            for n, value in enumerate(row):
+                values[n].append(value)
+        self.length = len(values[0]) if values else 0
+        self.data = dict()
+        for n, column in enumerate(self.columns):
+            if column.endswith(self.DATE_SUFFIXES):
+                self.data[column] = self.date_column([self.parse_date(m) for m in values[n]])
+            else:
+                self.data[column] = [intern(m) for m in values[n]]
+
+    def parse_date(self, value):
+        """Convert a report timestamp to epoch seconds, or to a negative code for non-date values
+
+        Args:
+            value (str): Timestamp like 2016-12-06T12:32:16+00:00, N/A or no_information
+
+        Returns:
+            int: Epoch seconds, or -1 - index of value in self.noDate
+        """
+        try:
+            return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[14:16]), int(value[17:19]), 0, 0, 0))
+        except ValueError:
+            if value not in self.noDate:
+                self.noDate.append(value)
+            return -1 - self.noDate.index(value)
+
+    def date_column(self, epochs):
+        """Store a parsed date column in its compact form
+
+        Args:
+            epochs (list): Epoch seconds per row
+
+        Returns:
+            numpy.ndarray or array.array: Date column
+        """
+        if numpy is not None:
+            return numpy.array(epochs, dtype='int64').astype('datetime64[s]')
+        return array('l', epochs)
+
+    def add_column(self, column, value):
+        """Add a column with the same value on every row
+
+        Args:
+            column (str): Column name
+            value (str): Value for all rows
+        """
+        self.columns.append(column)
+        if column.endswith(self.DATE_SUFFIXES):
+            self.data[column] = self.date_column([self.parse_date(value)] * self.length)
+        else:
+            self.data[column] = [intern(value)] * self.length
+
+    def column(self, column):
+        """Values of a non-date column
+
+        Args:
+            column (str): Column name
+
+        Returns:
+            list: One string per row
+        """
+        return self.data[column]
+
+    def timestamp(self, i, column):
+        """Epoch seconds of a date column on one row
+
+        Args:
+            i (int): Row number
+            column (str): Date column name
+
+        Returns:
+            int: Epoch seconds, None if the row has no date (N/A, no_information, ...)
+        """
+        value = self.data[column][i]
+        if numpy is not None:
+            value = value.astype('int64')
+        value = int(value)
+        if value < 0:
+            return None
+        return value
+
+    def age_days(self, column, now):
+        """Whole days between every date in a column and now
+
+        Args:
+            column (str): Date column name
+            now (int): Current time in epoch seconds
+
+        Returns:
+            list: Days per row, None for rows without a date
+        """
+        if numpy is not None:
+            epochs = self.data[column].astype('int64')
+            ages = ((now - epochs) // 86400).tolist()
+            for i in numpy.flatnonzero(epochs < 0).tolist():
+                ages[i] = None
+            return ages
+        return [None if m < 0 else (now - m) // 86400 for m in self.data[column]]
+
+    def value(self, i, column):
+        """Original report value of a column on one row
+
+        Args:
+            i (int): Row number
+            column (str): Column name
+
+        Returns:
+            str: Value as found in the CSV report
+        """
+        if not column.endswith(self.DATE_SUFFIXES):
+            return self.data[column][i]
+        epoch = self.timestamp(i, column)
+        if epoch is None:
+            value = self.data[column][i]
+            if numpy is not None:
+                value = value.astype('int64')
+            return self.noDate[-1 - int(value)]
+        return time.strftime(self.DATE_FORMAT, time.gmtime(epoch))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return CredentialReportRow(self, i)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield CredentialReportRow(self, i)
+
+
+class CredentialReportRow(object):
+    """Read only dict-like view of one CredentialReport row
+    """
+
+    def __init__(self, report, i):
+        self.report = report
+        self.i = i
+
+    def __getitem__(self, column):
+        return self.report.value(self.i, column)
+
+    def __contains__(self, column):
+        return column in self.report.data
+
+    def get(self, column, default=None):
+        try:
+            return self[column]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.report.columns)
+
+    def __iter__(self):
+        return iter(self.report.columns)
+
+
+def get_checked_cred_report():
+    """Credential report data source, a report that cannot be generated fails the run
+
+    Returns:
+        CredentialReport: Parsed report
+
+    Raises:
+        RuntimeError: With the Fail status of get_cred_report()
+    """
+    report = get_cred_report()
+    if not isinstance(report, CredentialReport):
+        raise RuntimeError(report)
+    return report
+
+
+def get_cred_report():
+    """Get the IAM credential report, reusing a cached or recently generated report when possible
+
+    A report younger than CRED_REPORT_MAX_AGE hours is read from CACHE_DIR, or taken from IAM
+    without generating a new one. Only when neither exists is a new report generated.
+
+    Returns:
+        CredentialReport: Parsed report, or a string starting with Fail if no report could be generated
+    """
+    account = get_account_id()
+    maxAge = CRED_REPORT_MAX_AGE * 3600
+    content = None
+    if maxAge > 0:
+        content = read_cached_cred_report(account, maxAge)
+        if content is None:
+            try:
+                response = get_client('iam').get_credential_report()
+                generated = calendar.timegm(response['GeneratedTime'].utctimetuple())
+                if time.time() - generated <= maxAge:
+                    content = response['Content']
+                    write_cached_cred_report(account, generated, content)
+            except Exception as e:
+                if "ReportNotPresent" not in str(e) and "ReportExpired" not in str(e):
+                    raise
+    if content is None:
+        x = 0
+        status = ""
+        while get_client('iam').generate_credential_report()['State'] != "COMPLETE":
+            time.sleep(2)
+            x += 1
+            # If no credentail report is delivered within this time fail the check.
+            if x > 10:
+                status = "Fail: rootUse - no CredentialReport available."
+                break
+        if "Fail" in status:
+            return status
+        response = get_client('iam').get_credential_report()
+        content = response['Content']
+        if maxAge > 0:
+            write_cached_cred_report(account, calendar.timegm(response['GeneratedTime'].utctimetuple()), content)
+    report = CredentialReport(content)
+
+    # Verify if root key's never been used, if so add N/A
+    for column in ('access_key_1_last_used_date', 'access_key_2_last_used_date'):
+        if column not in report.data:
+            report.add_column(column, "N/A")
+    return report
+
+
+def read_cached_cred_report(account, maxAge):
+    """Read the newest cached credential report of an account if it is recent enough
+
+    Args:
+        account (str): Account id
+        maxAge (float): Maximum report age in seconds
+
+    Returns:
+        bytes: CSV content of the report, None if no usable report is cached
+    """
+    prefix = "credreport_" + account + "_"
+    try:
+        cached = [n for n in os.listdir(CACHE_DIR) if n.startswith(prefix) and n.endswith(".csv")]
+    except OSError:
+        return None
+    for name in sorted(cached, key=lambda n: int(n[len(prefix):-4]), reverse=True):
+        if time.time() - int(name[len(prefix):-4]) > maxAge:
+            break
+        try:
+            with open(os.path.join(CACHE_DIR, name), 'rb') as f:
+                return f.read()
+        except IOError:
+            continue
+    return None
+
+
+def write_cached_cred_report(account, generated, content):
+    """Store a credential report in CACHE_DIR, readable by the current user only
+
+    Older cached reports of the account are removed. Failures are ignored, the cache is optional.
+
+    Args:
+        account (str): Account id
+        generated (int): GeneratedTime of the report in epoch seconds
+        content (bytes): CSV content of the report
+    """
+    prefix = "credreport_" + account + "_"
+    name = os.path.join(CACHE_DIR, prefix + str(generated) + ".csv")
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0o700)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        temp = name + "." + str(os.getpid()) + ".tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(temp, name)
+        for n in os.listdir(CACHE_DIR):
+            if n.startswith(prefix) and n.endswith(".csv") and os.path.join(CACHE_DIR, n) != name:
+                os.unlink(os.path.join(CACHE_DIR, n))
+    except (IOError, OSError):
+        pass
+
+
+def get_iam_snapshot():
+    """Users, groups, roles and customer managed policies of the account, fetched once per run
+
+    Uses get_account_authorization_details, which returns inline policies, attached policies
+    and policy documents in a few paginated calls instead of one call per user or policy.
+    Only the fields used by the controls are kept.
+
+    Returns:
+        dict: Users, Groups and Roles with their inline policy names (UserPolicyList, GroupPolicyList,
+            RolePolicyList) and AttachedManagedPolicies arns, and Policies with the DefaultDocument
+            of every customer managed policy
+    """
+    def fetch():
+        snapshot = {'Users': [], 'Groups': [], 'Roles': [], 'Policies': []}
+        paginator = get_client('iam').get_paginator('get_account_authorization_details')
+        for page in paginator.paginate(Filter=['User', 'Group', 'Role', 'LocalManagedPolicy']):
+            for kind, detailList, inlineList in (('Users', 'UserDetailList', 'UserPolicyList'), ('Groups', 'GroupDetailList', 'GroupPolicyList'), ('Roles', 'RoleDetailList', 'RolePolicyList')):
+                for n in page.get(detailList, []):
+                    snapshot[kind].append({
+                        'Arn': n['Arn'],
+                        inlineList: [m['PolicyName'] for m in n.get(inlineList, [])],
+                        'AttachedManagedPolicies': [m['PolicyArn'] for m in n.get('AttachedManagedPolicies', [])]
+                    })
+            for n in page.get('Policies', []):
+                for m in n['PolicyVersionList']:
+                    if m['IsDefaultVersion']:
+                        snapshot['Policies'].append({'Arn': n['Arn'], 'DefaultVersionId': n['DefaultVersionId'], 'DefaultDocument': m['Document']})
+        return snapshot
+    return run_cached(('iam_snapshot',), fetch)
+
+
+def normalize_policy_document(document):
+    """Reduce a policy document to a compact, order independent list of statements
+
+    Single values and lists are both turned into sorted tuples and action names are lowercased,
+    so equivalent documents produce the same representation.
+
+    Args:
+        document (dict): IAM policy document
+
+    Returns:
+        list: Sorted statement tuples (effect, actionKey, actions, resourceKey, resources, condition)
+    """
+    def values(value):
+        if isinstance(value, list):
+            return tuple(sorted(set(str(n) for n in value)))
+        return (str(value),)
+
+    statements = document.get('Statement', [])
+    # a policy may contain a single statement, a single statement in an array, or multiple statements in an array
+    if not isinstance(statements, list):
+        statements = [statements]
+    normalized = []
+    for n in statements:
+        actionKey = 'NotAction' if 'NotAction' in n else 'Action'
+        resourceKey = 'NotResource' if 'NotResource' in n else 'Resource'
+        normalized.append((
+            str(n.get('Effect', '')),
+            actionKey,
+            tuple(sorted(set(m.lower() for m in values(n.get(actionKey, []))))),
+            resourceKey,
+            values(n.get(resourceKey, [])),
+            json.dumps(n.get('Condition', {}), sort_keys=True)
+        ))
+    return sorted(normalized)
+
+
+def statement_grants_admin(statement):
+    """Check if a normalized statement allows all actions on all resources
+
+    Action "*" or "*:*" counts. NotAction counts unless it excludes "*", "*:*" or any iam:
+    action: with all of IAM allowed the statement can grant itself the excluded actions, while
+    any IAM exclusion is treated as not administrative. A Condition does not make a statement
+    less administrative, it is only part of the normalized document.
+
+    Args:
+        statement (tuple): Statement as returned by normalize_policy_document()
+
+    Returns:
+        bool: True if the statement grants full administrative privileges
+    """
+    effect, actionKey, actions, resourceKey, resources, _ = statement
+    if effect != 'Allow':
+        return False
+    if resourceKey == 'Resource' and "*" not in resources:
+        return False
+    if actionKey == 'Action':
+        return "*" in actions or "*:*" in actions
+    for n in actions:
+        if n in ("*", "*:*") or n.startswith("iam:"):
+            return False
+    return True
+
+
+def policy_grants_admin(document):
+    """Check if a policy document grants full administrative privileges, memoized by document hash
+
+    Args:
+        document (dict): IAM policy document
+
+    Returns:
+        bool: True if any statement grants full administrative privileges
+    """
+    normalized = normalize_policy_document(document)
+    digest = hashlib.sha256((POLICY_RULES_VERSION + json.dumps(normalized)).encode('utf-8')).hexdigest()
+    with POLICY_EVALUATIONS_LOCK:
+        if not POLICY_EVALUATIONS and POLICY_EVALUATION_CACHE:
+            POLICY_EVALUATIONS.update(read_policy_evaluations())
+        if digest in POLICY_EVALUATIONS:
+            return POLICY_EVALUATIONS[digest]
+    grantsAdmin = any(statement_grants_admin(n) for n in normalized)
+    with POLICY_EVALUATIONS_LOCK:
+        POLICY_EVALUATIONS[digest] = grantsAdmin
+    return grantsAdmin
+
+
+def read_policy_evaluations():
+    """Read policy evaluations stored in CACHE_DIR by earlier runs
+
+    Returns:
+        dict: Evaluation per normalized document hash, empty if nothing is stored
+    """
+    try:
+        with open(os.path.join(CACHE_DIR, "policy_evaluations.json")) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_policy_evaluations():
+    """Store the policy evaluations of this run in CACHE_DIR for later runs
+
+    Failures are ignored, the cache is optional.
+    """
+    if not POLICY_EVALUATION_CACHE:
+        return
+    name = os.path.join(CACHE_DIR, "policy_evaluations.json")
+    with POLICY_EVALUATIONS_LOCK:
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR, 0o700)
+            temp = name + "." + str(os.getpid()) + ".tmp"
+            with open(temp, 'w') as f:
+                json.dump(POLICY_EVALUATIONS, f)
+            os.rename(temp, name)
+        except (IOError, OSError):
+            pass
+
+
+def fingerprint(data):
+    """Hash data into a fingerprint that changes whenever the data changes
+
+    Args:
+        data: JSON serializable data, sets and other values (datetime, ...) are allowed
+
+    Returns:
+        str: sha256 hex digest of the data
+    """
+    def serialize(value):
+        if isinstance(value, (set, frozenset)):
+            return sorted(value)
+        return str(value)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=serialize).encode('utf-8')).hexdigest()
+
+
+def run_control(control, inputs, *args):
+    """Run a control, measuring it when CONTROL_METRICS is enabled
+
+    API calls made by the control, also from the worker threads of run_in_pool(), are counted by
+    attach_metrics() into the metrics of the control. The metrics are added to the result as
+    Metrics, they are not part of stored results.
+
+    Args:
+        control (function): Control to run
+        inputs (list): (name, fetch) tuples, fetch returns input data of the control, None if the result may not be reused
+        *args: Arguments for the control
+
+    Returns:
+        dict: Control result
+    """
+    if not CONTROL_METRICS:
+        return reuse_or_run_control(control, inputs, args)[0]
+    metrics = new_metrics()
+    previous = getattr(METRICS_CONTEXT, 'metrics', None)
+    METRICS_CONTEXT.metrics = metrics
+    started = time.time()
+    try:
+        result, reused = reuse_or_run_control(control, inputs, args)
+    finally:
+        METRICS_CONTEXT.metrics = previous
+    metrics['WallTime'] = round(time.time() - started, 6)
+    metrics['Reused'] = reused
+    return dict(result, Metrics=metrics)
+
+
+def reuse_or_run_control(control, inputs, args):
+    """Run a control, or reuse its stored result when the data it is evaluated on is unchanged
+
+    The result is stored with a fingerprint of the account, this script (so any change to the
+    code or its settings invalidates results) and every input, and is reused for at most
+    CONTROL_RESULT_MAX_AGE hours. Only controls that depend on nothing but their inputs, and
+    not on the current time, should be given inputs.
+
+    Args:
+        control (function): Control to run
+        inputs (list): (name, fetch) tuples, fetch returns input data of the control, None if the result may not be reused
+        args (tuple): Arguments for the control
+
+    Returns:
+        tuple: Control result, and True if it is a stored result
+    """
+    if CONTROL_RESULT_CACHE is None or inputs is None:
+        return control(*args), False
+    inputFingerprints = [get_script_fingerprint(), get_account_id()]
+    for name, fetch in inputs:
+        inputFingerprints.append(run_cached(('fingerprint', name), lambda: fingerprint(fetch())))
+    key = fingerprint(inputFingerprints)
+    stored = get_control_results()
+    with CONTROL_RESULTS_LOCK:
+        entry = stored['Results'].get(control.__name__)
+    if entry is not None and entry['Fingerprint'] == key and time.time() - entry.get('Time', 0) < CONTROL_RESULT_MAX_AGE * 3600:
+        return entry['Result'], True
+    evaluated = time.time()
+    result = control(*args)
+    with CONTROL_RESULTS_LOCK:
+        stored['Results'][control.__name__] = {'Fingerprint': key, 'Result': result, 'Time': evaluated}
+        stored['Changed'] = True
+    return result, False
+
+
+def get_script_fingerprint():
+    """Fingerprint of this script, computed once per process
+
+    Returns:
+        str: sha256 hex digest of the script source
+    """
+    if 'script' not in SCRIPT_FINGERPRINT:
+        with open(__file__, 'rb') as f:
+            SCRIPT_FINGERPRINT['script'] = hashlib.sha256(f.read()).hexdigest()
+    return SCRIPT_FINGERPRINT['script']
+
+
+def get_control_results():
+    """Load the control results stored by the last run in this account, once per run
+
+    Returns:
+        dict: Results with the stored result and input fingerprint per control, Changed if this run added any
+    """
+    def load():
+        name = "control_results_" + get_account_id() + ".json"
+        try:
+            if CONTROL_RESULT_CACHE == "s3":
+                response = get_client('s3').get_object(Bucket=CONTROL_RESULT_CACHE_BUCKET, Key=CONTROL_RESULT_CACHE_PREFIX + name)
+                results = json.loads(response['Body'].read().decode('utf-8'))
+            else:
+                with open(os.path.join(CACHE_DIR, name)) as f:
+                    results = json.load(f)
+        except Exception:
+            # Nothing stored yet, or the store is not readable
+            results = dict()
+        return {'Results': results, 'Changed': False}
+    return run_cached(('control_results',), load)
+
+
+def save_control_results():
+    """Store the control results of this run for the next one, if any control was evaluated
+
+    Failures are ignored, stored results are optional.
+    """
+    if CONTROL_RESULT_CACHE is None:
+        return
+    stored = get_control_results()
+    if not stored['Changed']:
+        return
+    name = "control_results_" + get_account_id() + ".json"
+    with CONTROL_RESULTS_LOCK:
+        content = json.dumps(stored['Results'], sort_keys=True)
+    try:
+        if CONTROL_RESULT_CACHE == "s3":
+            get_client('s3').put_object(Bucket=CONTROL_RESULT_CACHE_BUCKET, Key=CONTROL_RESULT_CACHE_PREFIX + name, Body=content.encode('utf-8'))
+        else:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR, 0o700)
+            temp = os.path.join(CACHE_DIR, name + "." + str(os.getpid()) + ".tmp")
+            with open(temp, 'w') as f:
+                f.write(content)
+            os.rename(temp, os.path.join(CACHE_DIR, name))
+    except Exception:
+        pass
+
+
+def get_account_password_policy():
+    """Check if a IAM password policy exists, if not return false
+
+    Returns:
+        Account IAM password policy or False
+    """
+    try:
+        response = get_client('iam').get_account_password_policy()
         return response['PasswordPolicy']
     except Exception as e:
         if "cannot be found" in str(e):
@@ -1981,46 +3009,121 @@ def get_regions():
     Returns:
         TYPE: Description
     """
-    client = boto3.client('ec2')
+    client = get_client('ec2')
     region_response = client.describe_regions()
     regions = [region['RegionName'] for region in region_response['Regions']]
     return regions
 
 
 def get_cloudtrails(regions):
-    """Summary
+    """Discover all trails with list_trails and describe them per home region
+
+    Args:
+        regions (list): Region names to include
 
     Returns:
-        TYPE: Description
+        dict: Trails per home region, regions without trails are left out
     """
-    trails = dict()
-    for n in regions:
-        client = boto3.client('cloudtrail', region_name=n)
-        response = client.describe_trails()
-        temp = []
-        for m in response['trailList']:
-            if m['IsMultiRegionTrail'] is True:
-                if m['HomeRegion'] == n:
-                    temp.append(m)
-            else:
-                temp.append(m)
-        if len(temp) > 0:
-            trails[n] = temp
-    return trails
+    arns = dict()
+    for m in paginate_all(get_client('cloudtrail'), 'list_trails', 'Trails'):
+        if m['HomeRegion'] in regions:
+            arns.setdefault(m['HomeRegion'], []).append(m['TrailARN'])
+    homeRegions = [n for n in regions if n in arns]
 
+    def region_trails(n):
+        trailList = []
+        for i in range(0, len(arns[n]), TRAIL_DESCRIBE_CHUNK):
+            response = get_client('cloudtrail', n).describe_trails(trailNameList=arns[n][i:i + TRAIL_DESCRIBE_CHUNK])
+            # Shadow copies of multi region trails are only kept in their home region
+            trailList.extend(m for m in response['trailList'] if m['HomeRegion'] == n)
+        return trailList
+    return dict(zip(homeRegions, run_in_regions(homeRegions, region_trails)))
 
-def find_in_string(pattern, target):
-    """Summary
+
+def get_trail_status(trail):
+    """Get the status of a trail, get_trail_status is called once per trail ARN and run
+
+    Args:
+        trail (dict): Trail as returned by describe_trails
 
     Returns:
-        TYPE: Description
+        dict: Response of get_trail_status
     """
-    result = True
-    for n in pattern:
-        if not re.search(n, target):
-            result = False
-            break
-    return result
+    def fetch():
+        return get_client('cloudtrail', trail['HomeRegion']).get_trail_status(Name=trail['TrailARN'])
+    return run_cached(('trail_status', trail['TrailARN']), fetch)
+
+
+def get_trail_buckets(cloudtrails):
+    """Get ACL, logging and policy status of every bucket CloudTrail logs to, once per distinct bucket
+
+    Buckets are inspected concurrently through a client in the region of each bucket.
+
+    Args:
+        cloudtrails (dict): Trails per region as returned by get_cloudtrails()
+
+    Returns:
+        dict: Per bucket name the Acl, Logging and PolicyStatus responses, or AclError,
+            LoggingError and PolicyStatusError with the exception raised instead
+    """
+    def bucket_check(bucket):
+        metadata = dict()
+        try:
+            location = get_client('s3').get_bucket_location(Bucket=bucket)['LocationConstraint']
+            client = get_client('s3', {None: 'us-east-1', 'EU': 'eu-west-1'}.get(location, location))
+        except Exception as e:
+            if "NoSuchBucket" in str(e):
+                for name, _ in TRAIL_BUCKET_CALLS:
+                    metadata[name + 'Error'] = e
+                return metadata
+            # Without permission for the location the calls are tried in the default region
+            client = get_client('s3')
+        for name, operation in TRAIL_BUCKET_CALLS:
+            try:
+                response = getattr(client, operation)(Bucket=bucket)
+                metadata[name] = response.get(name, response)
+            except Exception as e:
+                metadata[name + 'Error'] = e
+        return metadata
+
+    def fetch():
+        buckets = sorted(set(o['S3BucketName'] for n in cloudtrails.values() for o in n if 'S3BucketName' in o))
+        return dict(zip(buckets, run_in_pool(TRAIL_BUCKET_WORKERS, buckets, bucket_check)))
+    return run_cached(('trail_buckets',), fetch)
+
+
+def match_metric_filter_controls(filterPattern):
+    """Match a metric filter pattern against the patterns of all section 3 controls at once
+
+    A regex is only run when the literals it requires are present in the filter,
+    and every distinct regex runs at most once per filter.
+
+    Args:
+        filterPattern (str): filterPattern of a CloudWatch Logs metric filter
+
+    Returns:
+        set: Ids of the controls whose patterns all match
+    """
+    matched = set()
+    results = dict()
+    for control, patterns in METRIC_FILTER_REGISTRY:
+        for literals, regex in patterns:
+            if regex.pattern not in results:
+                results[regex.pattern] = all(n in filterPattern for n in literals) and regex.search(filterPattern) is not None
+            if not results[regex.pattern]:
+                break
+        else:
+            matched.add(control)
+    return matched
+
+
+def get_account_id():
+    """Id of the account the current credentials belong to, looked up once per run
+
+    Returns:
+        str: Account id
+    """
+    return run_cached(('account_id',), lambda: get_client('sts').get_caller_identity()["Account"])
 
 
 def get_account_number():
@@ -2030,8 +3133,7 @@ def get_account_number():
         TYPE: Description
     """
     if S3_WEB_REPORT_OBFUSCATE_ACCOUNT is False:
-        client = boto3.client("sts")
-        account = client.get_caller_identity()["Account"]
+        account = get_account_id()
     else:
         account = "111111111111"
     return account
@@ -2047,7 +3149,7 @@ def set_evaluation(invokeEvent, mainEvent, annotation):
     Returns:
         TYPE: Description
     """
-    configClient = boto3.client('config')
+    configClient = get_client('config')
     if len(annotation) > 0:
         configClient.put_evaluations(
             Evaluations=[
@@ -2093,6 +3195,7 @@ def json2html(controlResult, account):
     table.append("<tr><td>Benchmark version: " + AWS_CIS_BENCHMARK_VERSION + "</td></tr>")
     table.append("<tr><td>Whitepaper location: <a href=\"https://d0.awsstatic.com/whitepapers/compliance/AWS_CIS_Foundations_Benchmark.pdf\" target=\"_blank\">https://d0.awsstatic.com/whitepapers/compliance/AWS_CIS_Foundations_Benchmark.pdf</a></td></tr>")
     table.append("<tr><td>" + shortReport + "</td></tr></table><br><br>")
+    table.extend(html_metrics_summary(controlResult))
     tableHeadOuter = "<table class=\"table table-outer\">"
     tableHeadInner = "<table class=\"table table-inner\">"
     tableHeadHover = "<table class=\"table table-hover\">"
@@ -2120,6 +3223,34 @@ def json2html(controlResult, account):
     return table
 
 
+def html_metrics_summary(controlResult):
+    """Run summary table of the control metrics, slowest control first
+
+    Args:
+        controlResult (list): Control results per section
+
+    Returns:
+        list: HTML lines, empty when the results have no Metrics
+    """
+    measured = [n for section in controlResult for n in section if 'Metrics' in n]
+    if not measured:
+        return []
+    rows = ["<table class=\"table table-inner\">"]
+    rows.append("<tr><th>Control</th><th>Wall time (s)</th><th>API calls</th><th>Retries</th><th>Throttles</th><th>Pages</th><th>Bytes received</th><th>Most called operation</th></tr>")
+    summary = [(n['ControlId'], n['Metrics']) for n in sorted(measured, key=lambda n: n['Metrics']['WallTime'], reverse=True)]
+    if RUN_METRICS:
+        summary.append(("Outside controls", RUN_METRICS))
+    for name, metrics in summary:
+        operations = [(m['ApiCalls'], service + "." + operation) for service in metrics['Services'] for operation, m in metrics['Services'][service].items()]
+        busiest = "%s (%d)" % (max(operations)[1], max(operations)[0]) if operations else ""
+        wallTime = "%.3f" % metrics['WallTime'] + (" (reused)" if metrics.get('Reused') else "") if name != "Outside controls" else ""
+        rows.append("<tr><th>" + name + "</th><td>" + wallTime + "</td><td>" + str(metrics['ApiCalls']) + "</td><td>" + str(metrics['Retries']) +
+                    "</td><td>" + str(metrics['Throttles']) + "</td><td>" + str(metrics['Pages']) + "</td><td>" + str(metrics['BytesReceived']) +
+                    "</td><td>" + busiest + "</td></tr>")
+    rows.append("</table><br><br>")
+    return rows
+
+
 def s3report(htmlReport, account):
     """Summary
 
@@ -2133,18 +3264,18 @@ def s3report(htmlReport, account):
         reportName = "cis_report_" + str(account) + "_" + str(datetime.now().strftime('%Y%m%d_%H%M')) + ".html"
     else:
         reportName = "cis_report.html"
-    with tempfile.NamedTemporaryFile(delete=False) as f:
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as f:
         for item in htmlReport:
             f.write(item)
             f.flush()
         try:
             f.close()
-            S3_CLIENT.upload_file(f.name, S3_WEB_REPORT_BUCKET, reportName)
+            get_client('s3').upload_file(f.name, S3_WEB_REPORT_BUCKET, reportName)
             os.unlink(f.name)
         except Exception as e:
             return "Failed to upload report to S3 because: " + str(e)
     ttl = int(S3_WEB_REPORT_EXPIRE) * 60
-    signedURL = S3_CLIENT.generate_presigned_url(
+    signedURL = get_client('s3').generate_presigned_url(
         'get_object',
         Params={
             'Bucket': S3_WEB_REPORT_BUCKET,
@@ -2154,16 +3285,15 @@ def s3report(htmlReport, account):
     return signedURL
 
 
-def json_output(controlResult):
-    """Summary
+def json_results(controlResult):
+    """Index control results by section and control number
 
     Args:
-        controlResult (TYPE): Description
+        controlResult (list): Control results per section
 
     Returns:
-        TYPE: Description
+        dict: Control results per control number per section number
     """
-    inner = dict()
     outer = dict()
     for m in range(len(controlResult)):
         inner = dict()
@@ -2172,6 +3302,19 @@ def json_output(controlResult):
             inner[x] = controlResult[m][n]
         y = controlResult[m][0]['ControlId'].split('.')[0]
         outer[y] = inner
+    return outer
+
+
+def json_output(controlResult):
+    """Summary
+
+    Args:
+        controlResult (TYPE): Description
+
+    Returns:
+        TYPE: Description
+    """
+    outer = json_results(controlResult)
     if OUTPUT_ONLY_JSON is True:
         print(json.dumps(outer, sort_keys=True, indent=4, separators=(',', ': ')))
     else:
@@ -2222,7 +3365,7 @@ def send_results_to_sns(url):
     """
     # Get correct region for the TopicARN
     region = (SNS_TOPIC_ARN.split("sns:", 1)[1]).split(":", 1)[0]
-    client = boto3.client('sns', region_name=region)
+    client = get_client('sns', region)
     client.publish(
         TopicArn=SNS_TOPIC_ARN,
         Subject="AWS CIS Benchmark report - " + str(time.strftime("%c")),
@@ -2231,6 +3374,272 @@ def send_results_to_sns(url):
     )
 
 
+# Data the controls are evaluated on: name -> (data sources it is built from, provider called with their values)
+DATA_SOURCES = {
+    'regions': ((), get_regions),
+    'cred_report': ((), get_checked_cred_report),
+    'password_policy': ((), get_account_password_policy),
+    'cloud_trails': (('regions',), get_cloudtrails),
+    # Input data of the controls whose results may be reused, fingerprinted by run_control()
+    'credential_report': (('cred_report',), lambda report: report.fingerprint),
+    'iam_snapshot': ((), get_iam_snapshot)
+}
+
+# Declaration of a control: sources are the DATA_SOURCES passed to the function as arguments, inputs the
+# DATA_SOURCES its result may be reused for (see run_control()), None for controls that depend on more,
+# like the current time, or whose data costs as much to fingerprint as the control costs to evaluate
+Control = namedtuple('Control', ['ControlId', 'function', 'scored', 'sources', 'inputs'])
+
+# All controls, in report order. Comment out unwanted controls.
+CONTROL_REGISTRY = [
+    Control('1.1', control_1_1_root_use, True, ('cred_report',), None),
+    Control('1.2', control_1_2_mfa_on_password_enabled_iam, True, ('cred_report',), ('credential_report',)),
+    Control('1.3', control_1_3_unused_credentials, True, ('cred_report',), None),
+    Control('1.4', control_1_4_rotated_keys, True, ('cred_report',), None),
+    Control('1.5', control_1_5_password_policy_uppercase, True, ('password_policy',), ('password_policy',)),
+    Control('1.6', control_1_6_password_policy_lowercase, True, ('password_policy',), ('password_policy',)),
+    Control('1.7', control_1_7_password_policy_symbol, True, ('password_policy',), ('password_policy',)),
+    Control('1.8', control_1_8_password_policy_number, True, ('password_policy',), ('password_policy',)),
+    Control('1.9', control_1_9_password_policy_length, True, ('password_policy',), ('password_policy',)),
+    Control('1.10', control_1_10_password_policy_reuse, True, ('password_policy',), ('password_policy',)),
+    Control('1.11', control_1_11_password_policy_expire, True, ('password_policy',), ('password_policy',)),
+    Control('1.12', control_1_12_root_key_exists, True, ('cred_report',), ('credential_report',)),
+    Control('1.13', control_1_13_root_mfa_enabled, True, (), None),
+    Control('1.14', control_1_14_root_hardware_mfa_enabled, True, (), None),
+    Control('1.15', control_1_15_security_questions_registered, False, (), None),
+    Control('1.16', control_1_16_no_policies_on_iam_users, True, (), ('iam_snapshot',)),
+    Control('1.17', control_1_17_detailed_billing_enabled, True, (), None),
+    Control('1.18', control_1_18_ensure_iam_master_and_manager_roles, True, (), None),
+    Control('1.19', control_1_19_maintain_current_contact_details, True, (), None),
+    Control('1.20', control_1_20_ensure_security_contact_details, True, (), None),
+    Control('1.21', control_1_21_ensure_iam_instance_roles_used, True, ('regions',), None),
+    Control('1.22', control_1_22_ensure_incident_management_roles, True, (), ('iam_snapshot',)),
+    Control('1.23', control_1_23_no_active_initial_access_keys_with_iam_user, False, ('cred_report',), ('credential_report',)),
+    Control('1.24', control_1_24_no_overly_permissive_policies, True, (), ('iam_snapshot',)),
+    Control('2.1', control_2_1_ensure_cloud_trail_all_regions, True, ('cloud_trails',), None),
+    Control('2.2', control_2_2_ensure_cloudtrail_validation, True, ('cloud_trails',), ('cloud_trails',)),
+    Control('2.3', control_2_3_ensure_cloudtrail_bucket_not_public, True, ('cloud_trails',), None),
+    Control('2.4', control_2_4_ensure_cloudtrail_cloudwatch_logs_integration, True, ('cloud_trails',), ('cloud_trails',)),
+    Control('2.5', control_2_5_ensure_config_all_regions, True, ('regions',), None),
+    Control('2.6', control_2_6_ensure_cloudtrail_bucket_logging, True, ('cloud_trails',), None),
+    Control('2.7', control_2_7_ensure_cloudtrail_encryption_kms, True, ('cloud_trails',), ('cloud_trails',)),
+    Control('2.8', control_2_8_ensure_kms_cmk_rotation, True, ('regions',), None),
+    Control('3.1', control_3_1_ensure_log_metric_filter_unauthorized_api_calls, True, ('cloud_trails',), None),
+    Control('3.2', control_3_2_ensure_log_metric_filter_console_signin_no_mfa, True, ('cloud_trails',), None),
+    Control('3.3', control_3_3_ensure_log_metric_filter_root_usage, True, ('cloud_trails',), None),
+    Control('3.4', control_3_4_ensure_log_metric_iam_policy_change, True, ('cloud_trails',), None),
+    Control('3.5', control_3_5_ensure_log_metric_cloudtrail_configuration_changes, True, ('cloud_trails',), None),
+    Control('3.6', control_3_6_ensure_log_metric_console_auth_failures, True, ('cloud_trails',), None),
+    Control('3.7', control_3_7_ensure_log_metric_disabling_scheduled_delete_of_kms_cmk, True, ('cloud_trails',), None),
+    Control('3.8', control_3_8_ensure_log_metric_s3_bucket_policy_changes, True, ('cloud_trails',), None),
+    Control('3.9', control_3_9_ensure_log_metric_config_configuration_changes, True, ('cloud_trails',), None),
+    Control('3.10', control_3_10_ensure_log_metric_security_group_changes, True, ('cloud_trails',), None),
+    Control('3.11', control_3_11_ensure_log_metric_nacl, True, ('cloud_trails',), None),
+    Control('3.12', control_3_12_ensure_log_metric_changes_to_network_gateways, True, ('cloud_trails',), None),
+    Control('3.13', control_3_13_ensure_log_metric_changes_to_route_tables, True, ('cloud_trails',), None),
+    Control('3.14', control_3_14_ensure_log_metric_changes_to_vpc, True, ('cloud_trails',), None),
+    Control('3.15', control_3_15_verify_sns_subscribers, False, (), None),
+    Control('4.1', control_4_1_ensure_ssh_not_open_to_world, True, ('regions',), None),
+    Control('4.2', control_4_2_ensure_rdp_not_open_to_world, True, ('regions',), None),
+    Control('4.3', control_4_3_ensure_flow_logs_enabled_on_all_vpc, True, ('regions',), None),
+    Control('4.4', control_4_4_ensure_default_security_groups_restricts_traffic, True, ('regions',), None),
+    Control('4.5', control_4_5_ensure_route_tables_are_least_access, False, ('regions',), None)
+]
+
+
+def evaluate_control(control, names, reuse, *values):
+    """Run a declared control on the values of its data sources, task of run_scheduled()
+
+    Args:
+        control (Control): Control declaration
+        names (list): Data source names of values
+        reuse (bool): Pass the inputs of the control to run_control(), to reuse a stored result
+        *values: Data source values
+
+    Returns:
+        dict: Control result
+    """
+    data = dict(zip(names, values))
+    inputs = [(n, functools.partial(data.get, n)) for n in control.inputs] if reuse else None
+    return run_control(control.function, inputs, *[data[n] for n in control.sources])
+
+
+def run_scheduled(controls, workers):
+    """Run controls, and the data sources they need, on a pool of workers
+
+    Every control and data source is a task that starts as soon as the data sources it depends on
+    are available. Sources the controls do not need are never fetched. An error in any task is
+    raised once the running tasks are finished, and RuntimeError when no task finishes within
+    TASK_TIMEOUT seconds.
+
+    Args:
+        controls (list): Control declarations from CONTROL_REGISTRY
+        workers (int): Maximum number of tasks running at once, 1 runs them one by one in order
+
+    Returns:
+        dict: Control result per ControlId
+    """
+    # Task key -> (keys of the tasks it depends on, function called with their values)
+    tasks = dict()
+    for control in controls:
+        # Inputs are only needed to find a stored result
+        reuse = CONTROL_RESULT_CACHE is not None and control.inputs is not None
+        names = list(control.sources) + [n for n in control.inputs or () if reuse and n not in control.sources]
+        tasks[('control', control.ControlId)] = ([('source', n) for n in names], functools.partial(evaluate_control, control, names, reuse))
+    pending = [n for dependencies, _ in list(tasks.values()) for n in dependencies]
+    while pending:
+        key = pending.pop()
+        if key not in tasks:
+            dependencies = [('source', n) for n in DATA_SOURCES[key[1]][0]]
+            tasks[key] = (dependencies, DATA_SOURCES[key[1]][1])
+            pending.extend(dependencies)
+    # Controls start in registry order, after the data sources they need
+    order = [('control', n.ControlId) for n in controls]
+    values = dict()
+
+    if workers <= 1:
+        def run(key):
+            if key not in values:
+                dependencies, function = tasks[key]
+                values[key] = function(*[run(n) for n in dependencies])
+            return values[key]
+        for key in order:
+            run(key)
+    else:
+        waiting = dict((key, set(tasks[key][0])) for key in tasks)
+        dependents = dict()
+        for key in tasks:
+            for n in tasks[key][0]:
+                dependents.setdefault(n, []).append(key)
+        completed = queue.Queue()
+        errors = []
+        running = [0]
+        pool = ThreadPool(workers)
+        started = set()
+
+        def execute(key):
+            # Also SystemExit and the like, the pool would otherwise lose the task without a word
+            try:
+                dependencies, function = tasks[key]
+                completed.put((key, function(*[values[n] for n in dependencies]), None))
+            except BaseException as e:
+                completed.put((key, None, e))
+
+        def start(keys):
+            for key in keys:
+                running[0] += 1
+                started.add(key)
+                pool.apply_async(execute, (key,))
+        hung = False
+        try:
+            start(sorted([n for n in tasks if not waiting[n]], key=lambda n: (n[0] == 'control', order.index(n) if n in order else 0)))
+            while running[0]:
+                try:
+                    key, value, error = completed.get(timeout=TASK_TIMEOUT)
+                except queue.Empty:
+                    hung = True
+                    raise RuntimeError("No control or data source finished within " + str(TASK_TIMEOUT) + " seconds, still running: " +
+                                       ", ".join(" ".join(n) for n in sorted(started)))
+                started.discard(key)
+                running[0] -= 1
+                if error is not None:
+                    errors.append(error)
+                    continue
+                values[key] = value
+                ready = []
+                for n in dependents.get(key, []):
+                    waiting[n].discard(key)
+                    if not waiting[n] and not errors:
+                        ready.append(n)
+                start(sorted(ready, key=lambda n: (n[0] == 'control', order.index(n) if n in order else 0)))
+        finally:
+            pool.close()
+            # Hung workers would never be joined, the pool threads are daemons
+            if not hung:
+                pool.join()
+        if errors:
+            raise errors[0]
+    return dict((key[1], values[key]) for key in order)
+
+
+def select_controls(controls=None, sections=None):
+    """Select controls of CONTROL_REGISTRY by control id and section number
+
+    Args:
+        controls (str or list): Control ids, comma separated or as a list, None for no selection by id
+        sections (str or list): Section numbers, comma separated or as a list, None for no selection by section
+
+    Returns:
+        list: Declarations of the controls selected by either, in registry order, all controls if both are None
+
+    Raises:
+        ValueError: For unknown control ids or section numbers
+    """
+    def split(value):
+        if value is None:
+            return set()
+        if not isinstance(value, (list, tuple, set)):
+            value = str(value).split(",")
+        return set(str(n).strip() for n in value if str(n).strip())
+    controls = split(controls)
+    sections = split(sections)
+    if not controls and not sections:
+        return list(CONTROL_REGISTRY)
+    knownControls = set(n.ControlId for n in CONTROL_REGISTRY)
+    knownSections = set(n.split('.')[0] for n in knownControls)
+    unknown = sorted(controls - knownControls) + sorted(sections - knownSections)
+    if unknown:
+        raise ValueError("Unknown controls or sections: " + ", ".join(unknown))
+    return [n for n in CONTROL_REGISTRY if n.ControlId in controls or n.ControlId.split('.')[0] in sections]
+
+
+def get_event_selection(event):
+    """Controls and sections to evaluate, from the event, the Config rule parameters or the script settings
+
+    Args:
+        event (dict): Lambda event, fields controls and sections, or ruleParameters of a Config rule with the same keys
+
+    Returns:
+        tuple: Control ids and section numbers for select_controls()
+    """
+    if not isinstance(event, dict):
+        return SELECTED_CONTROLS, SELECTED_SECTIONS
+    parameters = event.get('ruleParameters') or {}
+    if not isinstance(parameters, dict):
+        parameters = json.loads(parameters)
+    controls = event.get('controls', parameters.get('controls', SELECTED_CONTROLS))
+    sections = event.get('sections', parameters.get('sections', SELECTED_SECTIONS))
+    return controls, sections
+
+
+def run_benchmark(selection=None):
+    """Run controls of CONTROL_REGISTRY against the account of the default session
+
+    Args:
+        selection (list, optional): Control declarations to run, SELECTED_CONTROLS and SELECTED_SECTIONS if omitted
+
+    Returns:
+        list: Control results per section, in registry order
+    """
+    if selection is None:
+        selection = select_controls(SELECTED_CONTROLS, SELECTED_SECTIONS)
+    reset_run_cache()
+    RUN_METRICS.clear()
+    results = run_scheduled(selection, CONTROL_WORKERS)
+
+    # Join results per section
+    controls = []
+    sections = dict()
+    for control in selection:
+        section = control.ControlId.split('.')[0]
+        if section not in sections:
+            sections[section] = []
+            controls.append(sections[section])
+        sections[section].append(results[control.ControlId])
+    save_control_results()
+    return controls
+
+
 def lambda_handler(event, context):
     """Summary
 
@@ -2255,81 +3664,7 @@ def lambda_handler(event, context):
     except:
         configRule = False
 
-    # Globally used resources
-    region_list = get_regions()
-    cred_report = get_cred_report()
-    password_policy = get_account_password_policy()
-    cloud_trails = get_cloudtrails(region_list)
-    accountNumber = get_account_number()
-
-    # Run individual controls.
-    # Comment out unwanted controls
-    control1 = []
-    control1.append(control_1_1_root_use(cred_report))
-    control1.append(control_1_2_mfa_on_password_enabled_iam(cred_report))
-    control1.append(control_1_3_unused_credentials(cred_report))
-    control1.append(control_1_4_rotated_keys(cred_report))
-    control1.append(control_1_5_password_policy_uppercase(password_policy))
-    control1.append(control_1_6_password_policy_lowercase(password_policy))
-    control1.append(control_1_7_password_policy_symbol(password_policy))
-    control1.append(control_1_8_password_policy_number(password_policy))
-    control1.append(control_1_9_password_policy_length(password_policy))
-    control1.append(control_1_10_password_policy_reuse(password_policy))
-    control1.append(control_1_11_password_policy_expire(password_policy))
-    control1.append(control_1_12_root_key_exists(cred_report))
-    control1.append(control_1_13_root_mfa_enabled())
-    control1.append(control_1_14_root_hardware_mfa_enabled())
-    control1.append(control_1_15_security_questions_registered())
-    control1.append(control_1_16_no_policies_on_iam_users())
-    control1.append(control_1_17_detailed_billing_enabled())
-    control1.append(control_1_18_ensure_iam_master_and_manager_roles())
-    control1.append(control_1_19_maintain_current_contact_details())
-    control1.append(control_1_20_ensure_security_contact_details())
-    control1.append(control_1_21_ensure_iam_instance_roles_used())
-    control1.append(control_1_22_ensure_incident_management_roles())
-    control1.append(control_1_23_no_active_initial_access_keys_with_iam_user(cred_report))
-    control1.append(control_1_24_no_overly_permissive_policies())
-
-    control2 = []
-    control2.append(control_2_1_ensure_cloud_trail_all_regions(cloud_trails))
-    control2.append(control_2_2_ensure_cloudtrail_validation(cloud_trails))
-    control2.append(control_2_3_ensure_cloudtrail_bucket_not_public(cloud_trails))
-    control2.append(control_2_4_ensure_cloudtrail_cloudwatch_logs_integration(cloud_trails))
-    control2.append(control_2_5_ensure_config_all_regions(region_list))
-    control2.append(control_2_6_ensure_cloudtrail_bucket_logging(cloud_trails))
-    control2.append(control_2_7_ensure_cloudtrail_encryption_kms(cloud_trails))
-    control2.append(control_2_8_ensure_kms_cmk_rotation(region_list))
-
-    control3 = []
-    control3.append(control_3_1_ensure_log_metric_filter_unauthorized_api_calls(cloud_trails))
-    control3.append(control_3_2_ensure_log_metric_filter_console_signin_no_mfa(cloud_trails))
-    control3.append(control_3_3_ensure_log_metric_filter_root_usage(cloud_trails))
-    control3.append(control_3_4_ensure_log_metric_iam_policy_change(cloud_trails))
-    control3.append(control_3_5_ensure_log_metric_cloudtrail_configuration_changes(cloud_trails))
-    control3.append(control_3_6_ensure_log_metric_console_auth_failures(cloud_trails))
-    control3.append(control_3_7_ensure_log_metric_disabling_scheduled_delete_of_kms_cmk(cloud_trails))
-    control3.append(control_3_8_ensure_log_metric_s3_bucket_policy_changes(cloud_trails))
-    control3.append(control_3_9_ensure_log_metric_config_configuration_changes(cloud_trails))
-    control3.append(control_3_10_ensure_log_metric_security_group_changes(cloud_trails))
-    control3.append(control_3_11_ensure_log_metric_nacl(cloud_trails))
-    control3.append(control_3_12_ensure_log_metric_changes_to_network_gateways(cloud_trails))
-    control3.append(control_3_13_ensure_log_metric_changes_to_route_tables(cloud_trails))
-    control3.append(control_3_14_ensure_log_metric_changes_to_vpc(cloud_trails))
-    control3.append(control_3_15_verify_sns_subscribers())
-
-    control4 = []
-    control4.append(control_4_1_ensure_ssh_not_open_to_world(region_list))
-    control4.append(control_4_2_ensure_rdp_not_open_to_world(region_list))
-    control4.append(control_4_3_ensure_flow_logs_enabled_on_all_vpc(region_list))
-    control4.append(control_4_4_ensure_default_security_groups_restricts_traffic(region_list))
-    control4.append(control_4_5_ensure_route_tables_are_least_access(region_list))
-
-    # Join results
-    controls = []
-    controls.append(control1)
-    controls.append(control2)
-    controls.append(control3)
-    controls.append(control4)
+    controls = run_benchmark(select_controls(*get_event_selection(event)))
 
     # Build JSON structure for console output if enabled
     if SCRIPT_OUTPUT_JSON:
@@ -2337,6 +3672,7 @@ def lambda_handler(event, context):
 
     # Create HTML report file if enabled
     if S3_WEB_REPORT:
+        accountNumber = get_account_number()
         htmlReport = json2html(controls, accountNumber)
         if S3_WEB_REPORT_OBFUSCATE_ACCOUNT:
             for n, _ in enumerate(htmlReport):
@@ -2353,38 +3689,436 @@ def lambda_handler(event, context):
         set_evaluation(invokingEvent, event, evalAnnotation)
 
 
+class AssumedRoleCredentialProvider(CredentialProvider):
+    """Credential provider for a role assumed by get_role_credentials()
+
+    Inserted first in the credential chain of a session, so the profile of the session still
+    provides the region and configuration, but not the credentials.
+    """
+
+    METHOD = 'cis-assume-role'
+
+    def __init__(self, refresh):
+        """Create the provider
+
+        Args:
+            refresh (function): Returns credentials as returned by get_role_credentials()
+        """
+        super(AssumedRoleCredentialProvider, self).__init__()
+        self.refresh = refresh
+
+    def load(self):
+        """Credentials that are refreshed by botocore when they are about to expire
+
+        Returns:
+            botocore.credentials.DeferredRefreshableCredentials: Credentials of the role
+        """
+        return DeferredRefreshableCredentials(refresh_using=self.refresh, method='assume-role')
+
+
+def get_assumed_role_session(baseSession, roleArn, sessionName):
+    """Create a session for an assumed role, with credentials that are refreshed ahead of expiry
+
+    All clients built from the session share its credentials. Credentials come from
+    get_role_credentials(), so the role is only assumed again when they are about to expire.
+    The profile, region and configuration of the base session are kept.
+
+    Args:
+        baseSession (boto3.session.Session): Session allowed to assume the role
+        roleArn (str): Role to assume
+        sessionName (str): Role session name
+
+    Returns:
+        boto3.session.Session: Session using the role
+    """
+    # Not recorded, the responses hold the role credentials and a replayed scan assumes no roles
+    stsClient = baseSession.client('sts', config=CLIENT_CONFIG)
+
+    def refresh():
+        return get_role_credentials(stsClient, roleArn, sessionName)
+
+    # Assume the role now, so a role that cannot be assumed fails the account before any control runs
+    refresh()
+    botocoreSession = botocore.session.Session(profile=get_profile_name(baseSession))
+    resolver = botocoreSession.get_component('credential_provider')
+    # The chain starts with env, or with the profile when one is selected
+    resolver.insert_before(resolver.providers[0].METHOD, AssumedRoleCredentialProvider(refresh))
+    schedule_role_credentials_refresh(stsClient, roleArn, sessionName)
+    return boto3.Session(botocore_session=botocoreSession, region_name=baseSession.region_name)
+
+
+def get_role_credentials(stsClient, roleArn, sessionName):
+    """Get credentials for a role from memory or CACHE_DIR, or assume the role if they expire within STS_REFRESH_AHEAD
+
+    Args:
+        stsClient (botocore.client.BaseClient): STS client used to assume the role
+        roleArn (str): Role to assume
+        sessionName (str): Role session name
+
+    Returns:
+        dict: access_key, secret_key, token, expiry_time (ISO 8601) and expiry_epoch
+    """
+    key = (roleArn, sessionName)
+    with ROLE_CREDENTIALS_LOCK:
+        credentials = ROLE_CREDENTIALS.get(key)
+        if credentials is None and STS_CREDENTIAL_CACHE:
+            credentials = read_cached_role_credentials(roleArn, sessionName)
+        if credentials is None or credentials['expiry_epoch'] - time.time() <= STS_REFRESH_AHEAD:
+            response = stsClient.assume_role(RoleArn=roleArn, RoleSessionName=sessionName)['Credentials']
+            credentials = {
+                'access_key': response['AccessKeyId'],
+                'secret_key': response['SecretAccessKey'],
+                'token': response['SessionToken'],
+                'expiry_time': response['Expiration'].isoformat(),
+                'expiry_epoch': calendar.timegm(response['Expiration'].utctimetuple())
+            }
+            if STS_CREDENTIAL_CACHE:
+                write_cached_role_credentials(roleArn, sessionName, credentials)
+        ROLE_CREDENTIALS[key] = credentials
+    return credentials
+
+
+def schedule_role_credentials_refresh(stsClient, roleArn, sessionName):
+    """Refresh the credentials of a role in a background thread as soon as get_role_credentials() would
+
+    boto3 then finds fresh credentials in memory instead of waiting for STS in the middle of a control.
+
+    Args:
+        stsClient (botocore.client.BaseClient): STS client used to assume the role
+        roleArn (str): Role to assume
+        sessionName (str): Role session name
+    """
+    def refresh_ahead():
+        try:
+            get_role_credentials(stsClient, roleArn, sessionName)
+            schedule_role_credentials_refresh(stsClient, roleArn, sessionName)
+        except Exception:
+            # boto3 still refreshes on demand, try again in a minute
+            retry = threading.Timer(60, refresh_ahead)
+            retry.daemon = True
+            retry.start()
+
+    credentials = ROLE_CREDENTIALS[(roleArn, sessionName)]
+    # One second after the credentials come within STS_REFRESH_AHEAD of expiry, so get_role_credentials()
+    # refreshes them when the timer fires, but not more often than once a minute
+    delay = credentials['expiry_epoch'] - STS_REFRESH_AHEAD + 1 - time.time()
+    timer = threading.Timer(max(delay, 60), refresh_ahead)
+    timer.daemon = True
+    timer.start()
+
+
+def read_cached_role_credentials(roleArn, sessionName):
+    """Read credentials of a role stored in CACHE_DIR
+
+    Args:
+        roleArn (str): Role ARN
+        sessionName (str): Role session name
+
+    Returns:
+        dict: Credentials as returned by get_role_credentials(), None if none are stored
+    """
+    name = "sts_" + hashlib.sha256((roleArn + "\n" + sessionName).encode('utf-8')).hexdigest() + ".json"
+    try:
+        with open(os.path.join(CACHE_DIR, name)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_cached_role_credentials(roleArn, sessionName, credentials):
+    """Store credentials of a role in CACHE_DIR, readable by the current user only
+
+    Failures are ignored, the cache is optional.
+
+    Args:
+        roleArn (str): Role ARN
+        sessionName (str): Role session name
+        credentials (dict): Credentials as returned by get_role_credentials()
+    """
+    name = os.path.join(CACHE_DIR, "sts_" + hashlib.sha256((roleArn + "\n" + sessionName).encode('utf-8')).hexdigest() + ".json")
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0o700)
+        temp = name + "." + str(os.getpid()) + ".tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(credentials, f)
+        os.rename(temp, name)
+    except (IOError, OSError):
+        pass
+
+
+def get_org_accounts():
+    """List the active accounts of the organization
+
+    Returns:
+        list: Account ids
+    """
+    accounts = paginate_all(get_client('organizations'), 'list_accounts', 'Accounts')
+    return [str(m['Id']) for m in accounts if m['Status'] == 'ACTIVE']
+
+
+def get_scan_settings():
+    """Collect the settings an organization scan passes to its account processes
+
+    Returns:
+        dict: Values of ORG_SCAN_SETTINGS, and the profile and region of the default session
+    """
+    settings = dict((n, globals()[n]) for n in ORG_SCAN_SETTINGS)
+    session = get_default_session()
+    settings['Profile'] = get_profile_name(session)
+    settings['Region'] = session.region_name
+    return settings
+
+
+def apply_scan_settings(settings):
+    """Apply the settings of an organization scan in an account process
+
+    Processes that are spawned instead of forked start from the defaults of the script,
+    so the command line options are not inherited.
+
+    Args:
+        settings (dict): Settings from get_scan_settings
+    """
+    globals().update((n, settings[n]) for n in ORG_SCAN_SETTINGS)
+    # Replayed calls are not sent, but presigned report URLs still need credentials to sign with
+    if REPLAY_DIR:
+        boto3.setup_default_session(aws_access_key_id="replay", aws_secret_access_key="replay", region_name=settings['Region'])
+    else:
+        boto3.setup_default_session(profile_name=settings['Profile'], region_name=settings['Region'])
+
+
+def scan_account(scan):
+    """Run the benchmark in one account of an organization scan, in its own process
+
+    Every exception is caught, so one failing account does not abort the scan.
+
+    Args:
+        scan (tuple): Account id, partition, role name, output directory and settings from get_scan_settings
+
+    Returns:
+        dict: Account, Status (OK or Error), failed and passed control ids or the Error
+    """
+    global RECORD_SCOPE
+    account, partition, roleName, outputDir, settings = scan
+    # Clients and data inherited from the parent process belong to another account
+    CLIENTS.clear()
+    reset_run_cache()
+    RECORDING.clear()
+    RECORD_SCOPE = account
+    try:
+        apply_scan_settings(settings)
+        # Replayed calls need no credentials
+        if not REPLAY_DIR:
+            boto3.DEFAULT_SESSION = get_assumed_role_session(
+                get_default_session(),
+                "arn:" + partition + ":iam::" + account + ":role/" + roleName,
+                "cis-benchmark-" + account
+            )
+        controls = run_benchmark()
+        with open(os.path.join(outputDir, account + ".json"), 'w') as f:
+            json.dump(json_results(controls), f, sort_keys=True, indent=4, separators=(',', ': '))
+    except Exception as e:
+        return {'Account': account, 'Status': 'Error', 'Error': str(e)}
+    finally:
+        save_recording()
+    failed = [n['ControlId'] for m in controls for n in m if n['Result'] is False]
+    passed = [n['ControlId'] for m in controls for n in m if n['Result'] is True]
+    return {'Account': account, 'Status': 'OK', 'Failed': failed, 'Passed': passed}
+
+
+def run_scan_process(scan, connection):
+    """Run scan_account() in an account process and send its summary to the parent
+
+    Args:
+        scan (tuple): Task as passed to scan_account()
+        connection (multiprocessing.Connection): Pipe to send the summary to
+    """
+    try:
+        connection.send(scan_account(scan))
+    finally:
+        connection.close()
+
+
+def scan_organization(accounts, roleName, processes, outputDir):
+    """Run the benchmark in many accounts, each in its own process, and write a fleet rollup
+
+    Results are written to <account>.json per account and fleet.json in outputDir.
+
+    Args:
+        accounts (list): Account ids
+        roleName (str): Role to assume in every account
+        processes (int): Number of accounts evaluated in parallel
+        outputDir (str): Directory for the results
+
+    Returns:
+        dict: Fleet rollup with the summary per account, failing accounts per control and accounts with errors
+    """
+    partition = get_client('sts').get_caller_identity()['Arn'].split(":")[1]
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    fleet = {'Accounts': dict(), 'Controls': dict(), 'Errors': []}
+    settings = get_scan_settings()
+    # A fresh process per account keeps clients, caches and failures of accounts apart. A process that dies
+    # without a summary (out of memory, killed) is reported as an error of its account.
+    scans = [(n, partition, roleName, outputDir, settings) for n in accounts]
+    running = dict()
+    while scans or running:
+        while scans and len(running) < max(1, processes):
+            scan = scans.pop(0)
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=run_scan_process, args=(scan, sender))
+            process.start()
+            sender.close()
+            running[scan[0]] = (process, receiver)
+        finished = []
+        for account, (process, receiver) in sorted(running.items()):
+            # The summary is sent before the process exits, so poll again once it is gone
+            if not receiver.poll() and process.is_alive():
+                continue
+            try:
+                summary = receiver.recv()
+            except EOFError:
+                process.join()
+                summary = {'Account': account, 'Status': 'Error', 'Error': "Account process exited with code " + str(process.exitcode)}
+            receiver.close()
+            process.join()
+            finished.append(account)
+            fleet['Accounts'][summary['Account']] = summary
+            if summary['Status'] == 'OK':
+                for n in summary['Failed']:
+                    fleet['Controls'].setdefault(n, {'Failed': []})['Failed'].append(summary['Account'])
+            else:
+                fleet['Errors'].append(summary['Account'])
+            if OUTPUT_ONLY_JSON is False:
+                if summary['Status'] == 'OK':
+                    print(summary['Account'] + ": " + str(len(summary['Failed'])) + " failed controls")
+                else:
+                    print(summary['Account'] + ": Error - " + summary['Error'])
+        for account in finished:
+            del running[account]
+        if not finished:
+            time.sleep(0.1)
+    for n in fleet['Controls'].values():
+        n['Failed'].sort()
+    fleet['Errors'].sort()
+    with open(os.path.join(outputDir, "fleet.json"), 'w') as f:
+        json.dump(fleet, f, sort_keys=True, indent=4, separators=(',', ': '))
+    if OUTPUT_ONLY_JSON is True:
+        print(json.dumps(fleet, sort_keys=True, indent=4, separators=(',', ': ')))
+    return fleet
+
+
+def usage():
+    """Print command line usage
+    """
+    print('Run without parameters to use default profile:')
+    print("python " + sys.argv[0] + "\n")
+    print("Use -p or --profile to specify a specific profile:")
+    print("python " + sys.argv[0] + ' -p <profile>' + "\n")
+    print("Use -w or --workers to set how many regions are evaluated in parallel (default " + str(REGION_WORKERS) + "):")
+    print("python " + sys.argv[0] + ' -w <workers>' + "\n")
+    print("Use --control-workers to set how many controls are evaluated in parallel, 1 for one by one (default " + str(CONTROL_WORKERS) + "):")
+    print("python " + sys.argv[0] + ' --control-workers <workers>' + "\n")
+    print("Use --cache-dir to set where data reused between runs is cached (default " + CACHE_DIR + "):")
+    print("python " + sys.argv[0] + ' --cache-dir <directory>' + "\n")
+    print("Use --cred-report-max-age to set how many hours old a reused credential report may be, 0 disables reuse (default " + str(CRED_REPORT_MAX_AGE) + "):")
+    print("python " + sys.argv[0] + ' --cred-report-max-age <hours>' + "\n")
+    print("Use --accounts with a comma separated list of account ids, or --org for all active accounts of the organization, to scan many accounts:")
+    print("python " + sys.argv[0] + ' --org [--role-name <role>] [--processes <processes>] [--output-dir <directory>]' + "\n")
+    print("--role-name is the role assumed in every account (default " + ORG_SCAN_ROLE_NAME + ")")
+    print("--processes is how many accounts are evaluated in parallel (default " + str(ORG_SCAN_PROCESSES) + ")")
+    print("--output-dir is where the result of every account and fleet.json are written (default " + ORG_SCAN_OUTPUT_DIR + ")\n")
+    print("Use --record to save all AWS API responses of a run, and --replay to run again on the saved responses without AWS:")
+    print("python " + sys.argv[0] + ' --record <directory>')
+    print("python " + sys.argv[0] + ' --replay <directory> [--replay-latency <recorded|seconds>]' + "\n")
+    print("Use --metrics to add the wall time and API calls of every control to the JSON output and HTML report:")
+    print("python " + sys.argv[0] + ' --metrics' + "\n")
+    print("Use --controls and --sections to evaluate only some controls, and fetch only the data they need:")
+    print("python " + sys.argv[0] + ' --controls 4.1,4.3 --sections 2,3')
+
+
 if __name__ == '__main__':
     profile_name = ''
+    accounts = None
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "p:h", ["profile=", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "p:w:h", ["profile=", "workers=", "control-workers=", "cache-dir=", "cred-report-max-age=", "accounts=", "org", "role-name=", "processes=", "output-dir=", "record=", "replay=", "replay-latency=", "metrics", "controls=", "sections=", "help"])
     except getopt.GetoptError:
         print("Error: Illegal option\n")
         print("---Usage---")
-        print('Run without parameters to use default profile:')
-        print("python " + sys.argv[0] + "\n")
-        print("Use -p or --profile to specify a specific profile:")
-        print("python " + sys.argv[0] + ' -p <profile>')
+        usage()
         sys.exit(2)
 
     # Parameter options
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             print("---Help---")
-            print('Run without parameters to use default profile:')
-            print("python " + sys.argv[0] + "\n")
-            print("Use -p or --profile to specify a specific profile:")
-            print("python " + sys.argv[0] + ' -p <profile>')
+            usage()
             sys.exit()
         elif opt in ("-p", "--profile"):
             profile_name = arg
+        elif opt in ("-w", "--workers"):
+            try:
+                REGION_WORKERS = int(arg)
+            except ValueError:
+                print("Error: Workers must be a number")
+                sys.exit(2)
+        elif opt == "--control-workers":
+            try:
+                CONTROL_WORKERS = int(arg)
+            except ValueError:
+                print("Error: Control workers must be a number")
+                sys.exit(2)
+        elif opt == "--cache-dir":
+            CACHE_DIR = arg
+        elif opt == "--cred-report-max-age":
+            try:
+                CRED_REPORT_MAX_AGE = float(arg)
+            except ValueError:
+                print("Error: Credential report max age must be a number")
+                sys.exit(2)
+        elif opt == "--accounts":
+            accounts = [n.strip() for n in arg.split(",") if n.strip()]
+        elif opt == "--org":
+            accounts = []
+        elif opt == "--role-name":
+            ORG_SCAN_ROLE_NAME = arg
+        elif opt == "--processes":
+            try:
+                ORG_SCAN_PROCESSES = int(arg)
+            except ValueError:
+                print("Error: Processes must be a number")
+                sys.exit(2)
+        elif opt == "--output-dir":
+            ORG_SCAN_OUTPUT_DIR = arg
+        elif opt == "--record":
+            RECORD_DIR = arg
+        elif opt == "--replay":
+            REPLAY_DIR = arg
+        elif opt == "--replay-latency":
+            if arg != "recorded":
+                try:
+                    float(arg)
+                except ValueError:
+                    print("Error: Replay latency must be recorded or a number of seconds")
+                    sys.exit(2)
+            REPLAY_LATENCY = arg
+        elif opt == "--metrics":
+            CONTROL_METRICS = True
+        elif opt == "--controls":
+            SELECTED_CONTROLS = arg
+        elif opt == "--sections":
+            SELECTED_SECTIONS = arg
+    try:
+        select_controls(SELECTED_CONTROLS, SELECTED_SECTIONS)
+    except ValueError as e:
+        print("Error: " + str(e))
+        sys.exit(2)
 
     # Verify that the profile exist
     if not profile_name == "":
         try:
             boto3.setup_default_session(profile_name=profile_name)
-            # Update globals with new profile
-            IAM_CLIENT = boto3.client('iam')
-            S3_CLIENT = boto3.client('s3')
         except Exception as e:
             if "could not be found" in str(e):
                 print("Error: " + str(e))
@@ -2393,11 +4127,21 @@ if __name__ == '__main__':
 
     # Test if default region is configured for the used profile, if not we will use us-east-1
     try:
-        client = boto3.client('ec2')
+        client = get_client('ec2')
     except Exception as e:
         if "You must specify a region" in str(e):
             if profile_name == "":
                 boto3.setup_default_session(region_name='us-east-1')
             else:
                 boto3.setup_default_session(profile_name=profile_name, region_name='us-east-1')
-    lambda_handler("test", "test")
+    # Replayed calls are not sent, but presigned report URLs still need credentials to sign with
+    if REPLAY_DIR:
+        boto3.setup_default_session(aws_access_key_id="replay", aws_secret_access_key="replay", region_name=get_client('ec2').meta.region_name)
+        CLIENTS.clear()
+    if accounts is None:
+        lambda_handler("test", "test")
+    else:
+        if not accounts:
+            accounts = get_org_accounts()
+        scan_organization(accounts, ORG_SCAN_ROLE_NAME, ORG_SCAN_PROCESSES, ORG_SCAN_OUTPUT_DIR)
+    save_recording()
@@ -0,0 +1,393 @@
+"""Offline benchmark of aws-cis-foundation-benchmark-checklist.py
+
+Runs the stages of the checklist against fixed-size synthetic accounts from simulator.py:
+lambda_handler, lambda_handler_reused (a second run reusing stored control results), every
+control_* function, get_cred_report, json2html and json_output. Every
+stage runs in its own forked process, after the data it needs has been prepared there, and
+reports wall time, CPU time, AWS API calls and peak RSS. Results are written as JSON and
+compared with the baseline in baseline.json, the exit status is 1 when a metric regressed past
+its threshold or there is no baseline.
+
+Usage:
+    python benchmark.py [--dataset <name>] [--stage <prefix>] [--repeat <n>] [--output <file>]
+                        [--baseline <file>] [--write-baseline] [--no-baseline-ok] [--threshold <metric>=<ratio>]
+"""
+from __future__ import print_function
+import getopt
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from simulator import SCALES, Simulator, SyntheticAccount, Capture, load_checklist, prepare_checklist
+
+# --- Benchmark controls ---
+
+# Synthetic accounts the stages run against, a name in simulator.SCALES or sizes overriding the small scale
+DATASETS = {
+    'small': 'small',
+    'medium': {
+        'users': 5000, 'policies': 500, 'regions': 8, 'security_groups': 500, 'vpcs': 50, 'route_tables': 100,
+        'instances': 1000, 'trails': 50, 'metric_filters': 50, 'kms_keys': 300, 'buckets': 5
+    }
+}
+
+# Datasets run when none is given
+DEFAULT_DATASETS = ['small', 'medium']
+
+# Seed of the synthetic accounts, fixed so API call counts are comparable between runs
+DATASET_SEED = 0
+
+# Results of a run are written here, and compared with the baseline
+RESULTS_FILE = "benchmark-results.json"
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A metric regressed when it is above baseline * ratio. API calls only change with the code, times and RSS
+# also vary between runs and machines.
+THRESHOLDS = {
+    'api_calls': 1.0,
+    'wall_time': 2.0,
+    'cpu_time': 2.0,
+    'peak_rss_kb': 1.25
+}
+
+# Differences below these are noise, however large the ratio, as with stages taking a few milliseconds
+MIN_DIFFERENCES = {
+    'wall_time': 0.25,
+    'cpu_time': 0.25,
+    'peak_rss_kb': 16384
+}
+
+# Arguments of the control functions by parameter name, built in the stage process before timing
+CONTROL_ARGUMENTS = {
+    'credreport': lambda checklist, inputs: checklist.get_cred_report(),
+    'passwordpolicy': lambda checklist, inputs: checklist.get_account_password_policy(),
+    'regions': lambda checklist, inputs: inputs['regions'],
+    'cloudtrails': lambda checklist, inputs: checklist.get_cloudtrails(inputs['regions'])
+}
+
+
+def control_key(name):
+    """Sort control functions by their number, control_1_10 after control_1_9"""
+    return [int(n) for n in name.split("_")[1:3]]
+
+
+def get_stages(checklist):
+    """List the stage names of the checklist
+
+    Args:
+        checklist (module): Loaded checklist
+
+    Returns:
+        list: Stage names, control functions by number
+    """
+    controls = sorted([n for n in dir(checklist) if n.startswith("control_") and n.split("_")[1].isdigit()], key=control_key)
+    return ['lambda_handler', 'lambda_handler_reused', 'get_cred_report'] + controls + ['json2html', 'json_output']
+
+
+def prepare_stage(checklist, stage):
+    """Prepare the input of a stage, returning the call to measure
+
+    Args:
+        checklist (module): Loaded checklist, pointed at a simulated session
+        stage (str): Stage name from get_stages()
+
+    Returns:
+        function: Stage call without arguments
+    """
+    if stage == 'lambda_handler':
+        return lambda: checklist.lambda_handler({}, None)
+    if stage == 'lambda_handler_reused':
+        # The first run stores the control results in the cache directory of the stage process
+        checklist.CONTROL_RESULT_CACHE = "local"
+        stdout = sys.stdout
+        sys.stdout = Capture([])
+        try:
+            checklist.lambda_handler({}, None)
+        finally:
+            sys.stdout = stdout
+        return lambda: checklist.lambda_handler({}, None)
+    if stage == 'get_cred_report':
+        return checklist.get_cred_report
+    checklist.reset_run_cache()
+    if stage in ('json2html', 'json_output'):
+        controls = checklist.run_benchmark()
+        if stage == 'json_output':
+            return lambda: checklist.json_output(controls)
+        account = checklist.get_account_number()
+        return lambda: checklist.json2html(controls, account)
+    control = getattr(checklist, stage)
+    try:
+        names = inspect.getfullargspec(control).args
+    except AttributeError:
+        names = inspect.getargspec(control).args
+    inputs = {'regions': checklist.get_regions()}
+    args = [CONTROL_ARGUMENTS[n](checklist, inputs) for n in names]
+    return lambda: control(*args)
+
+
+def read_rss():
+    """Current and peak resident set size of this process in KB, from /proc when available
+
+    Returns:
+        tuple: (current, peak), current is None without /proc
+    """
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(n.split(":", 1) for n in f.read().splitlines() if ":" in n)
+        return int(status['VmRSS'].split()[0]), int(status['VmHWM'].split()[0])
+    except (IOError, OSError, KeyError):
+        return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS, on Linux 4.0 and newer"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except (IOError, OSError):
+        pass
+
+
+def run_stage(checklist, account, stage, latency, connection):
+    """Measure one stage, in a forked process, and send the metrics through a pipe
+
+    Args:
+        checklist (module): Loaded checklist
+        account (SyntheticAccount): Dataset to run against
+        stage (str): Stage name from get_stages()
+        latency (float): Simulated latency per call in seconds
+        connection (multiprocessing.Connection): Pipe to send the metrics dict to
+    """
+    cacheDir = tempfile.mkdtemp(prefix="cis-benchmark-")
+    try:
+        simulator = Simulator(account, latency=latency)
+        prepare_checklist(checklist, simulator.session(), cacheDir, report=True)
+        call = prepare_stage(checklist, stage)
+        callsBefore = sum(simulator.calls.values())
+        reset_peak_rss()
+        rssBefore = read_rss()[0]
+        usageBefore = resource.getrusage(resource.RUSAGE_SELF)
+        stdout = sys.stdout
+        sys.stdout = Capture([])
+        started = time.time()
+        try:
+            call()
+        finally:
+            finished = time.time()
+            sys.stdout = stdout
+        usageAfter = resource.getrusage(resource.RUSAGE_SELF)
+        peak = read_rss()[1]
+        connection.send({
+            'wall_time': finished - started,
+            'cpu_time': (usageAfter.ru_utime - usageBefore.ru_utime) + (usageAfter.ru_stime - usageBefore.ru_stime),
+            'api_calls': sum(simulator.calls.values()) - callsBefore,
+            'peak_rss_kb': peak,
+            'rss_growth_kb': peak - rssBefore if rssBefore is not None else None
+        })
+    except Exception:
+        connection.send({'error': traceback.format_exc()})
+    finally:
+        connection.close()
+        shutil.rmtree(cacheDir, ignore_errors=True)
+
+
+def measure(checklist, account, stage, latency, repeat):
+    """Run a stage repeat times in forked processes
+
+    Args:
+        checklist (module): Loaded checklist
+        account (SyntheticAccount): Dataset to run against
+        stage (str): Stage name from get_stages()
+        latency (float): Simulated latency per call in seconds
+        repeat (int): Number of runs
+
+    Returns:
+        dict: Median of every metric over the runs, or the error of the first failed run
+    """
+    context = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+    runs = []
+    for _ in range(repeat):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_stage, args=(checklist, account, stage, latency, sender))
+        process.start()
+        sender.close()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            result = {'error': "stage process exited with code " + str(process.join() or process.exitcode)}
+        process.join()
+        if 'error' in result:
+            return result
+        runs.append(result)
+    metrics = dict()
+    for name in runs[0]:
+        values = sorted(n[name] for n in runs if n[name] is not None)
+        metrics[name] = values[len(values) // 2] if values else None
+    return metrics
+
+
+def baseline_metrics(metrics):
+    """Metrics of a stage as stored in the baseline
+
+    Args:
+        metrics (dict): Stage metrics from measure()
+
+    Returns:
+        dict: The metrics compared by THRESHOLDS as measured, the error of a failed stage
+    """
+    if 'error' in metrics:
+        return {'error': metrics['error']}
+    return dict((n, round(metrics[n], 3) if isinstance(metrics[n], float) else metrics[n]) for n in THRESHOLDS)
+
+
+def compare(results, baseline, thresholds):
+    """Find the metrics of a run that regressed compared with a baseline
+
+    Args:
+        results (dict): Stage metrics of this run by "dataset/stage"
+        baseline (dict): Stage metrics of the baseline by "dataset/stage"
+        thresholds (dict): Allowed ratio per metric, smaller differences than MIN_DIFFERENCES are ignored
+
+    Returns:
+        list: Descriptions of the regressions
+    """
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        if key not in baseline or 'error' in metrics or 'error' in baseline[key]:
+            continue
+        for metric, ratio in sorted(thresholds.items()):
+            value = metrics.get(metric)
+            reference = baseline[key].get(metric)
+            if value is None or reference is None:
+                continue
+            if value > reference * ratio and value - reference >= MIN_DIFFERENCES.get(metric, 0):
+                regressions.append("%s %s: %s, baseline %s, threshold x%s" % (key, metric, format_metric(value), format_metric(reference), ratio))
+    return regressions
+
+
+def format_metric(value):
+    return "%.3f" % value if isinstance(value, float) else str(value)
+
+
+def usage():
+    print("Benchmark the checklist against synthetic accounts:")
+    print("python " + sys.argv[0] + " [--dataset <" + "|".join(sorted(set(DATASETS) | set(SCALES))) + ">] [--stage <prefix>] [--repeat <n>]")
+    print("    [--latency <seconds>] [--output <file>] [--baseline <file>] [--write-baseline] [--no-baseline-ok]")
+    print("    [--threshold <metric>=<ratio>]")
+
+
+def main(argv):
+    datasets = []
+    stagePrefixes = []
+    repeat = 1
+    latency = 0.0
+    output = RESULTS_FILE
+    baselineFile = BASELINE_FILE
+    writeBaseline = False
+    noBaselineOk = False
+    thresholds = dict(THRESHOLDS)
+    try:
+        opts, args = getopt.getopt(argv, "h", ["dataset=", "stage=", "repeat=", "latency=", "output=", "baseline=",
+                                               "write-baseline", "no-baseline-ok", "threshold=", "help"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                return 0
+            elif opt == "--dataset":
+                if arg not in DATASETS and arg not in SCALES:
+                    raise ValueError("unknown dataset " + arg)
+                datasets.append(arg)
+            elif opt == "--stage":
+                stagePrefixes.append(arg)
+            elif opt == "--repeat":
+                repeat = max(1, int(arg))
+            elif opt == "--latency":
+                latency = float(arg)
+            elif opt == "--output":
+                output = arg
+            elif opt == "--baseline":
+                baselineFile = arg
+            elif opt == "--write-baseline":
+                writeBaseline = True
+            elif opt == "--no-baseline-ok":
+                noBaselineOk = True
+            elif opt == "--threshold":
+                metric, ratio = arg.split("=", 1)
+                if metric not in THRESHOLDS:
+                    raise ValueError("unknown metric " + metric)
+                thresholds[metric] = float(ratio)
+    except (getopt.GetoptError, ValueError) as e:
+        print("Error: " + str(e) + "\n")
+        usage()
+        return 2
+
+    checklist = load_checklist()
+    stages = [n for n in get_stages(checklist) if not stagePrefixes or any(n.startswith(m) for m in stagePrefixes)]
+    results = dict()
+    print("%-75s %9s %9s %7s %10s %10s" % ("stage", "wall s", "cpu s", "calls", "peak KB", "growth KB"))
+    for dataset in datasets or DEFAULT_DATASETS:
+        account = SyntheticAccount(DATASETS.get(dataset, dataset), DATASET_SEED)
+        for stage in stages:
+            key = dataset + "/" + stage
+            metrics = measure(checklist, account, stage, latency, repeat)
+            results[key] = metrics
+            if 'error' in metrics:
+                print("%-75s failed:\n%s" % (key, metrics['error']))
+            else:
+                print("%-75s %9.3f %9.3f %7d %10s %10s" % (key, metrics['wall_time'], metrics['cpu_time'], metrics['api_calls'],
+                                                        metrics['peak_rss_kb'], metrics['rss_growth_kb']))
+            sys.stdout.flush()
+
+    document = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'latency': latency,
+        'stages': results
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, sort_keys=True, indent=4, separators=(',', ': '))
+    print("\nResults written to " + output)
+    failed = sorted(n for n, m in results.items() if 'error' in m)
+    for n in failed:
+        print("Failed: " + n)
+
+    if writeBaseline:
+        baseline = dict()
+        if os.path.exists(baselineFile):
+            with open(baselineFile) as f:
+                baseline = json.load(f)['stages']
+        baseline.update((n, baseline_metrics(m)) for n, m in results.items())
+        with open(baselineFile, "w") as f:
+            json.dump({'seed': DATASET_SEED, 'latency': latency, 'python': platform.python_version(), 'platform': platform.platform(),
+                       'stages': baseline}, f, sort_keys=True, indent=4, separators=(',', ': '))
+            f.write("\n")
+        print("Baseline written to " + baselineFile)
+        return 1 if failed else 0
+    if not os.path.exists(baselineFile):
+        print("No baseline at " + baselineFile + ", run with --write-baseline to store one")
+        if noBaselineOk:
+            return 1 if failed else 0
+        return 1
+    with open(baselineFile) as f:
+        baseline = json.load(f)['stages']
+    regressions = compare(results, baseline, thresholds)
+    for n in regressions:
+        print("Regression: " + n)
+    if regressions or failed:
+        return 1
+    print("No regressions against " + baselineFile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,835 @@
+"""Synthetic AWS account for scale testing aws-cis-foundation-benchmark-checklist.py
+
+Answers the AWS API calls made by the checklist from generated data through the boto3 event
+system, so nothing is sent to AWS and no credentials are needed. The size of the account is
+configurable, up to tens of thousands of IAM users and security groups. Every call can be
+delayed, and a share of the calls can be throttled, with retries emulated like botocore's
+legacy retry mode.
+
+The organization scan (--accounts, --org) is not simulated: it creates a session per account,
+which this simulator is not installed on.
+
+Usage:
+    python simulator.py [--scale small|large] [--latency <seconds>] [--throttle-rate <0..1>] [--seed <n>]
+                        [--controls <ids>] [--sections <numbers>] [--result-cache]
+
+Or from Python:
+    checklist = load_checklist()
+    simulator = Simulator(SyntheticAccount('large'), latency=0.02, throttle_rate=0.01)
+    session = simulator.session()
+    run_checklist(checklist, session)
+"""
+from __future__ import print_function
+import getopt
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+import boto3
+import botocore.session
+from botocore.awsrequest import AWSResponse
+from dateutil.tz import tzutc
+
+CHECKLIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "aws-cis-foundation-benchmark-checklist.py")
+
+# Size of the synthetic account. Security groups, VPCs, route tables, instances and KMS keys are per region.
+SCALES = {
+    'small': {
+        'users': 500, 'policies': 50, 'regions': 4, 'security_groups': 100, 'vpcs': 10, 'route_tables': 20,
+        'instances': 100, 'trails': 10, 'metric_filters': 20, 'kms_keys': 50, 'buckets': 3
+    },
+    'large': {
+        'users': 50000, 'policies': 5000, 'regions': 20, 'security_groups': 3000, 'vpcs': 200, 'route_tables': 600,
+        'instances': 5000, 'trails': 300, 'metric_filters': 200, 'kms_keys': 2000, 'buckets': 20
+    }
+}
+
+REGION_NAMES = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'eu-west-1', 'eu-west-2', 'eu-west-3',
+    'eu-central-1', 'eu-north-1', 'eu-south-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+    'ap-southeast-1', 'ap-southeast-2', 'sa-east-1', 'me-south-1', 'af-south-1'
+]
+
+# Page size per service when the caller sets none, like the AWS defaults
+DEFAULT_PAGE_SIZES = {'ec2': 1000, 'iam': 100, 'kms': 100, 'logs': 50, 'cloudtrail': 50, 'cloudwatch': 50}
+
+CREDENTIAL_REPORT_COLUMNS = [
+    'user', 'arn', 'user_creation_time', 'password_enabled', 'password_last_used', 'password_last_changed',
+    'password_next_rotation', 'mfa_active', 'access_key_1_active', 'access_key_1_last_rotated',
+    'access_key_1_last_used_date', 'access_key_1_last_used_region', 'access_key_1_last_used_service',
+    'access_key_2_active', 'access_key_2_last_rotated', 'access_key_2_last_used_date',
+    'access_key_2_last_used_region', 'access_key_2_last_used_service', 'cert_1_active', 'cert_1_last_rotated',
+    'cert_2_active', 'cert_2_last_rotated'
+]
+
+# Metric filter patterns as recommended by the benchmark, some log groups get a few of them
+CIS_FILTER_PATTERNS = [
+    '{ ($.errorCode = "*UnauthorizedOperation") || ($.errorCode = "AccessDenied*") }',
+    '{ $.userIdentity.type = "Root" && $.userIdentity.invokedBy NOT EXISTS && $.eventType != "AwsServiceEvent" }',
+    '{ ($.eventName = CreateTrail) || ($.eventName = UpdateTrail) || ($.eventName = DeleteTrail) || ($.eventName = StartLogging) || ($.eventName = StopLogging) }',
+    '{ ($.eventName = ConsoleLogin) && ($.errorMessage = "Failed authentication") }',
+    '{ ($.eventName = AuthorizeSecurityGroupIngress) || ($.eventName = AuthorizeSecurityGroupEgress) || ($.eventName = RevokeSecurityGroupIngress) || ($.eventName = RevokeSecurityGroupEgress) || ($.eventName = CreateSecurityGroup) || ($.eventName = DeleteSecurityGroup) }'
+]
+
+
+def load_checklist(path=CHECKLIST):
+    """Load the checklist script by path, its file name is not importable
+
+    Args:
+        path (str): Path of aws-cis-foundation-benchmark-checklist.py
+
+    Returns:
+        module: The checklist, not run
+    """
+    try:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('checklist', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except ImportError:
+        import imp
+        return imp.load_source('checklist', path)
+
+
+def prepare_checklist(checklist, session, cache_dir, report=False, result_cache=None):
+    """Point a loaded checklist at a simulated session
+
+    Policy evaluations are not cached, and control results only with result_cache, so every run in an
+    empty cache directory does the same work.
+
+    Args:
+        checklist (module): Checklist as returned by load_checklist()
+        session (boto3.session.Session): Session from Simulator.session()
+        cache_dir (str): Cache directory of the checklist, removed by the caller
+        report (bool): Also build the HTML report and upload it (to the simulator)
+        result_cache (str, optional): CONTROL_RESULT_CACHE of the checklist, "local" to store control results in cache_dir
+    """
+    boto3.DEFAULT_SESSION = session
+    checklist.CLIENTS.clear()
+    checklist.CACHE_DIR = cache_dir
+    checklist.CONTROL_RESULT_CACHE = result_cache
+    checklist.POLICY_EVALUATION_CACHE = False
+    checklist.POLICY_EVALUATIONS.clear()
+    checklist.S3_WEB_REPORT = report
+    checklist.S3_WEB_REPORT_BUCKET = "simulator-reports"
+    checklist.SCRIPT_OUTPUT_JSON = True
+    checklist.OUTPUT_ONLY_JSON = True
+
+
+def run_checklist(checklist, session, report=False, event=None, cache_dir=None, result_cache=None):
+    """Run lambda_handler of a loaded checklist against a simulated session
+
+    Args:
+        checklist (module): Checklist as returned by load_checklist()
+        session (boto3.session.Session): Session from Simulator.session()
+        report (bool): Also build the HTML report and upload it (to the simulator)
+        event (dict, optional): Lambda event, for example with controls and sections to evaluate
+        cache_dir (str, optional): Cache directory kept between runs, a temporary one is removed after the run if omitted
+        result_cache (str, optional): CONTROL_RESULT_CACHE of the checklist, "local" to reuse control results of earlier runs
+
+    Returns:
+        str: Console output of the run
+    """
+    directory = cache_dir or tempfile.mkdtemp(prefix="cis-simulator-")
+    output = []
+    stdout = sys.stdout
+    try:
+        prepare_checklist(checklist, session, directory, report, result_cache)
+        sys.stdout = Capture(output)
+        checklist.lambda_handler(event or {}, None)
+    finally:
+        sys.stdout = stdout
+        if cache_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    return "".join(output)
+
+
+def copy_structure(value):
+    """Copy the dicts and lists of a response, leaving the values shared"""
+    if isinstance(value, dict):
+        return dict((k, copy_structure(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [copy_structure(n) for n in value]
+    return value
+
+
+class Capture(object):
+    """Minimal stdout replacement collecting everything written"""
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, text):
+        self.output.append(text)
+
+    def flush(self):
+        pass
+
+
+class SyntheticAccount(object):
+    """Generated, deterministic content of one AWS account
+
+    Region data is generated on first use and kept, from a random generator seeded per region,
+    so the content does not depend on the order or concurrency of the calls.
+    """
+
+    def __init__(self, scale='small', seed=0, account='123456789012'):
+        """Args:
+            scale (str or dict): Name in SCALES, or a dict overriding sizes of the small scale
+            seed (int): Seed of the generated content
+            account (str): Account id
+        """
+        self.scale = dict(SCALES['small'])
+        self.scale.update(SCALES[scale] if isinstance(scale, str) else scale)
+        self.seed = seed
+        self.account = account
+        self.now = int(time.time())
+        self.regions = REGION_NAMES[:max(1, min(self.scale['regions'], len(REGION_NAMES)))]
+        self.lock = threading.Lock()
+        self.regionData = dict()
+        self.generate_iam()
+        self.generate_trails()
+
+    def random(self, name):
+        return random.Random("%s-%s" % (self.seed, name))
+
+    def date(self, epoch):
+        return datetime.fromtimestamp(epoch, tzutc())
+
+    def report_date(self, epoch):
+        return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(epoch)) if epoch else "N/A"
+
+    def arn(self, service, resource, region=""):
+        return "arn:aws:" + service + ":" + region + ":" + self.account + ":" + resource
+
+    def generate_iam(self):
+        rng = self.random('iam')
+        day = 86400
+        self.users = []
+        for i in range(self.scale['users']):
+            created = self.now - rng.randint(1, 1500) * day
+            user = {'name': "user%05d" % i, 'created': created, 'password': rng.random() < 0.6, 'mfa': rng.random() < 0.7, 'keys': []}
+            user['password_last_used'] = self.now - rng.randint(0, 200) * day if user['password'] and rng.random() < 0.9 else None
+            for _ in range(rng.choice((0, 1, 1, 2))):
+                # One in a hundred keys was created together with the user
+                rotated = created if rng.random() < 0.01 else created + rng.randint(0, self.now - created)
+                user['keys'].append({
+                    'id': "AKIA%016d" % rng.randint(0, 10 ** 16 - 1),
+                    'active': rng.random() < 0.8,
+                    'rotated': rotated,
+                    'used': rotated + rng.randint(0, self.now - rotated) if rng.random() < 0.8 else None
+                })
+            self.users.append(user)
+        self.userKeys = dict((n['name'], n['keys']) for n in self.users)
+
+        self.policies = []
+        for i in range(self.scale['policies']):
+            if rng.random() < 0.01:
+                statement = {'Effect': 'Allow', 'Action': '*', 'Resource': '*'}
+            else:
+                statement = {
+                    'Effect': 'Allow',
+                    'Action': ["s3:GetObject", "s3:PutObject", "ec2:Describe*", "logs:PutLogEvents"][:rng.randint(1, 4)],
+                    'Resource': "arn:aws:s3:::bucket%d/*" % rng.randint(0, 100)
+                }
+            self.policies.append({'name': "policy%05d" % i, 'document': {'Version': '2012-10-17', 'Statement': [statement]}})
+        policyArns = [self.arn('iam', "policy/" + n['name']) for n in self.policies]
+
+        def attached(count):
+            return [{'PolicyName': n.split("/")[-1], 'PolicyArn': n} for n in rng.sample(policyArns, min(count, len(policyArns)))]
+
+        inline = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:ListBucket', 'Resource': '*'}]}
+        trust = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Principal': {'Service': 'ec2.amazonaws.com'}, 'Action': 'sts:AssumeRole'}]}
+        created = self.date(self.now - 400 * day)
+        self.authorizationDetails = []
+        for n in self.users:
+            self.authorizationDetails.append(('UserDetailList', {
+                'UserName': n['name'], 'UserId': "AIDA" + n['name'].upper(), 'Arn': self.arn('iam', "user/" + n['name']), 'Path': '/',
+                'CreateDate': self.date(n['created']), 'GroupList': [],
+                'UserPolicyList': [{'PolicyName': 'inline', 'PolicyDocument': quote(json.dumps(inline))}] if rng.random() < 0.02 else [],
+                'AttachedManagedPolicies': attached(rng.randint(0, 2))
+            }))
+        for i in range(max(1, self.scale['users'] // 50)):
+            self.authorizationDetails.append(('GroupDetailList', {
+                'GroupName': "group%04d" % i, 'GroupId': "AGPA%012d" % i, 'Arn': self.arn('iam', "group/group%04d" % i), 'Path': '/',
+                'CreateDate': created, 'GroupPolicyList': [], 'AttachedManagedPolicies': attached(rng.randint(1, 3))
+            }))
+        for i in range(max(2, self.scale['users'] // 10)):
+            policies = attached(rng.randint(0, 3))
+            if i == 0:
+                policies.append({'PolicyName': 'AWSSupportAccess', 'PolicyArn': 'arn:aws:iam::aws:policy/AWSSupportAccess'})
+            self.authorizationDetails.append(('RoleDetailList', {
+                'RoleName': "role%05d" % i, 'RoleId': "AROA%012d" % i, 'Arn': self.arn('iam', "role/role%05d" % i), 'Path': '/',
+                'CreateDate': created, 'AssumeRolePolicyDocument': quote(json.dumps(trust)), 'InstanceProfileList': [],
+                'RolePolicyList': [], 'AttachedManagedPolicies': policies
+            }))
+        for n, arn in zip(self.policies, policyArns):
+            self.authorizationDetails.append(('Policies', {
+                'PolicyName': n['name'], 'PolicyId': "ANPA" + n['name'].upper(), 'Arn': arn, 'Path': '/', 'DefaultVersionId': 'v1',
+                'AttachmentCount': 1, 'IsAttachable': True, 'CreateDate': created, 'UpdateDate': created,
+                'PolicyVersionList': [{'Document': quote(json.dumps(n['document'])), 'VersionId': 'v1', 'IsDefaultVersion': True, 'CreateDate': created}]
+            }))
+
+        rows = [",".join(CREDENTIAL_REPORT_COLUMNS)]
+        root = ['<root_account>', self.arn('iam', 'root'), self.report_date(self.now - 2000 * day), 'not_supported',
+                self.report_date(self.now - 30 * day), 'not_supported', 'not_supported', 'true',
+                'false', 'N/A', 'N/A', 'N/A', 'N/A', 'false', 'N/A', 'N/A', 'N/A', 'N/A', 'false', 'N/A', 'false', 'N/A']
+        rows.append(",".join(root))
+        for n in self.users:
+            row = [n['name'], self.arn('iam', "user/" + n['name']), self.report_date(n['created']),
+                   'true' if n['password'] else 'false',
+                   self.report_date(n['password_last_used']) if n['password'] and n['password_last_used'] else ('no_information' if n['password'] else 'N/A'),
+                   self.report_date(n['created']) if n['password'] else 'N/A', 'N/A', 'true' if n['mfa'] else 'false']
+            for i in range(2):
+                if i < len(n['keys']):
+                    key = n['keys'][i]
+                    row += ['true' if key['active'] else 'false', self.report_date(key['rotated']), self.report_date(key['used']),
+                            'us-east-1' if key['used'] else 'N/A', 's3' if key['used'] else 'N/A']
+                else:
+                    row += ['false', 'N/A', 'N/A', 'N/A', 'N/A']
+            row += ['false', 'N/A', 'false', 'N/A']
+            rows.append(",".join(row))
+        self.credentialReport = ("\n".join(rows) + "\n").encode('utf-8')
+
+    def generate_trails(self):
+        rng = self.random('trails')
+        self.buckets = ["cloudtrail-logs-%s-%02d" % (self.account, i) for i in range(max(1, self.scale['buckets']))]
+        self.bucketRegions = dict((n, rng.choice(self.regions)) for n in self.buckets)
+        self.trails = []
+        for i in range(self.scale['trails']):
+            region = rng.choice(self.regions)
+            trail = {
+                'Name': "trail%04d" % i, 'S3BucketName': rng.choice(self.buckets), 'IncludeGlobalServiceEvents': True,
+                'IsMultiRegionTrail': rng.random() < 0.3, 'HomeRegion': region,
+                'TrailARN': self.arn('cloudtrail', "trail/trail%04d" % i, region),
+                'LogFileValidationEnabled': rng.random() < 0.7, 'HasCustomEventSelectors': False, 'IsOrganizationTrail': False
+            }
+            if rng.random() < 0.6:
+                trail['CloudWatchLogsLogGroupArn'] = self.arn('logs', "log-group:trail-logs-%04d:*" % i, region)
+                trail['CloudWatchLogsRoleArn'] = self.arn('iam', 'role/CloudTrailToCloudWatch')
+            if rng.random() < 0.5:
+                trail['KmsKeyId'] = self.arn('kms', "key/trail%04d" % i, region)
+            self.trails.append(trail)
+        self.trailsByArn = dict((n['TrailARN'], n) for n in self.trails)
+        self.trailLogging = dict((n['TrailARN'], rng.random() < 0.9) for n in self.trails)
+
+    def region(self, region):
+        """Generated content of a region
+
+        Args:
+            region (str): Region name
+
+        Returns:
+            dict: Lists and lookups of the region, see generate_region()
+        """
+        with self.lock:
+            if region not in self.regionData:
+                self.regionData[region] = self.generate_region(region)
+            return self.regionData[region]
+
+    def generate_region(self, region):
+        rng = self.random(region)
+        scale = self.scale
+        data = dict()
+        world = [{'CidrIp': '0.0.0.0/0'}]
+        vpcs = []
+        for i in range(scale['vpcs']):
+            vpcs.append({'VpcId': "vpc-%s%04d" % (region.replace("-", ""), i), 'State': 'available',
+                         'CidrBlock': "10.%d.0.0/16" % (i % 256), 'IsDefault': i == 0, 'OwnerId': self.account})
+        data['Vpcs'] = vpcs
+        data['FlowLogs'] = [{'FlowLogId': "fl-%s" % n['VpcId'][4:], 'ResourceId': n['VpcId'], 'FlowLogStatus': 'ACTIVE', 'TrafficType': 'ALL'}
+                            for n in vpcs if rng.random() < 0.5]
+        groups = []
+        for n in vpcs:
+            egress = [{'IpProtocol': '-1', 'IpRanges': world, 'Ipv6Ranges': [], 'PrefixListIds': [], 'UserIdGroupPairs': []}]
+            groups.append({'GroupId': "sg-d%s" % n['VpcId'][4:], 'GroupName': 'default', 'VpcId': n['VpcId'], 'OwnerId': self.account,
+                           'Description': 'default VPC security group', 'IpPermissions': [],
+                           'IpPermissionsEgress': egress if rng.random() < 0.5 else []})
+        for i in range(max(0, scale['security_groups'] - len(vpcs))):
+            permissions = []
+            for _ in range(rng.randint(1, 4)):
+                port = rng.choice((22, 80, 443, 3389, 5432, 8080))
+                source = world if rng.random() < 0.05 else [{'CidrIp': "10.%d.0.0/16" % rng.randint(0, 255)}]
+                permissions.append({'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port, 'IpRanges': source,
+                                    'Ipv6Ranges': [], 'PrefixListIds': [], 'UserIdGroupPairs': []})
+            groups.append({'GroupId': "sg-%s%05d" % (region.replace("-", ""), i), 'GroupName': "group%05d" % i,
+                           'VpcId': rng.choice(vpcs)['VpcId'] if vpcs else None, 'OwnerId': self.account, 'Description': 'synthetic',
+                           'IpPermissions': permissions,
+                           'IpPermissionsEgress': [{'IpProtocol': '-1', 'IpRanges': world, 'Ipv6Ranges': [], 'PrefixListIds': [], 'UserIdGroupPairs': []}]})
+        data['SecurityGroups'] = groups
+        tables = []
+        for i in range(scale['route_tables']):
+            vpc = rng.choice(vpcs) if vpcs else {'VpcId': None, 'CidrBlock': '10.0.0.0/16'}
+            routes = [{'DestinationCidrBlock': vpc['CidrBlock'], 'GatewayId': 'local', 'State': 'active'}]
+            for j in range(rng.randint(0, 6)):
+                routes.append({'DestinationCidrBlock': "172.%d.%d.0/%d" % (rng.randint(16, 31), rng.randint(0, 255), rng.choice((16, 20, 24, 24, 24))),
+                               'VpcPeeringConnectionId': "pcx-%s%04d" % (region.replace("-", ""), rng.randint(0, 50)), 'State': 'active'})
+            tables.append({'RouteTableId': "rtb-%s%05d" % (region.replace("-", ""), i), 'VpcId': vpc['VpcId'],
+                           'OwnerId': self.account, 'Routes': routes, 'Associations': []})
+        data['RouteTables'] = tables
+        reservations = []
+        instances = 0
+        while instances < scale['instances']:
+            count = min(rng.randint(1, 5), scale['instances'] - instances)
+            reservation = {'ReservationId': "r-%s%06d" % (region.replace("-", ""), instances), 'OwnerId': self.account, 'Instances': []}
+            for _ in range(count):
+                instance = {'InstanceId': "i-%s%07d" % (region.replace("-", ""), instances), 'State': {'Name': rng.choice(('running', 'running', 'stopped'))}}
+                if rng.random() < 0.8:
+                    instance['IamInstanceProfile'] = {'Arn': self.arn('iam', 'instance-profile/app'), 'Id': 'AIPA000000000000'}
+                reservation['Instances'].append(instance)
+                instances += 1
+            reservations.append(reservation)
+        data['Reservations'] = reservations
+
+        keys = []
+        data['KeyMetadata'] = dict()
+        data['Rotation'] = dict()
+        aliases = []
+        for i in range(scale['kms_keys']):
+            keyId = "%08x-0000-4000-8000-%012d" % (zlib.crc32(region.encode("utf-8")) & 0xffffffff, i)
+            arn = self.arn('kms', "key/" + keyId, region)
+            managed = rng.random() < 0.1
+            keys.append({'KeyId': keyId, 'KeyArn': arn})
+            data['KeyMetadata'][keyId] = {'KeyId': keyId, 'Arn': arn, 'AWSAccountId': self.account, 'Enabled': True,
+                                          'KeyManager': 'AWS' if managed else 'CUSTOMER', 'KeyState': 'Enabled',
+                                          'KeyUsage': 'ENCRYPT_DECRYPT', 'Origin': 'AWS_KMS', 'Description': ''}
+            data['Rotation'][keyId] = managed or rng.random() < 0.6
+            if managed:
+                aliases.append({'AliasName': "alias/aws/service%d" % i, 'AliasArn': self.arn('kms', "alias/aws/service%d" % i, region), 'TargetKeyId': keyId})
+            elif rng.random() < 0.5:
+                aliases.append({'AliasName': "alias/app%d" % i, 'AliasArn': self.arn('kms', "alias/app%d" % i, region), 'TargetKeyId': keyId})
+        data['Keys'] = keys
+        data['Aliases'] = aliases
+
+        data['MetricFilters'] = dict()
+        data['Alarms'] = dict()
+        data['Subscriptions'] = dict()
+        topic = self.arn('sns', 'security-alerts', region)
+        data['Subscriptions'][topic] = [{'SubscriptionArn': topic + ":1", 'Owner': self.account, 'Protocol': 'email',
+                                         'Endpoint': 'security@example.com', 'TopicArn': topic}]
+        for trail in self.trails:
+            if trail['HomeRegion'] != region or 'CloudWatchLogsLogGroupArn' not in trail:
+                continue
+            group = trail['CloudWatchLogsLogGroupArn'].split(":")[6]
+            filters = []
+            for i in range(scale['metric_filters']):
+                metric = "%s-metric%d" % (group, i)
+                if i < len(CIS_FILTER_PATTERNS) and rng.random() < 0.5:
+                    pattern = CIS_FILTER_PATTERNS[i]
+                else:
+                    pattern = '{ ($.eventName = "Event%d") }' % rng.randint(0, 10 ** 6)
+                filters.append({'filterName': "filter%d" % i, 'filterPattern': pattern, 'logGroupName': group, 'creationTime': self.now * 1000,
+                                'metricTransformations': [{'metricName': metric, 'metricNamespace': 'CISBenchmark', 'metricValue': '1'}]})
+                if rng.random() < 0.8:
+                    data['Alarms'][('CISBenchmark', metric)] = [{'AlarmName': metric, 'AlarmArn': self.arn('cloudwatch', "alarm:" + metric, region),
+                                                                 'MetricName': metric, 'Namespace': 'CISBenchmark', 'AlarmActions': [topic]}]
+            data['MetricFilters'][group] = filters
+        data['GlobalEvents'] = region == self.regions[0]
+        data['Recording'] = rng.random() < 0.9
+        return data
+
+
+class Simulator(object):
+    """Answer the AWS API calls of boto3 clients from a SyntheticAccount
+
+    Calls are answered in a before-call event handler, so botocore never sends a request. Call
+    counts per operation, throttled attempts and the simulated latency are kept in the simulator.
+    """
+
+    def __init__(self, account, latency=0.0, throttle_rate=0.0, max_attempts=5, retry_delay=0.05, seed=0):
+        """Args:
+            account (SyntheticAccount): Content to serve
+            latency (float): Seconds added to every call
+            throttle_rate (float): Share of the attempts answered with a Throttling error
+            max_attempts (int): Attempts per call before the Throttling error is returned, like botocore's legacy retries
+            retry_delay (float): Base of the exponential delay between attempts in seconds
+            seed (int): Seed of the throttling decisions
+        """
+        self.account = account
+        self.latency = latency
+        self.throttleRate = throttle_rate
+        self.maxAttempts = max_attempts
+        self.retryDelay = retry_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.failed = 0
+        self.paginators = dict()
+        self.sequences = dict()
+        self.loader = botocore.session.get_session()
+
+    def session(self, region='us-east-1'):
+        """Create a boto3 session whose clients are answered by this simulator
+
+        Args:
+            region (str): Default region of the session
+
+        Returns:
+            boto3.session.Session: Session with placeholder credentials
+        """
+        session = boto3.Session(aws_access_key_id='simulator', aws_secret_access_key='simulator', region_name=region)
+        self.install(session)
+        return session
+
+    def install(self, session):
+        """Answer the calls of all clients created from a session
+
+        Args:
+            session (boto3.session.Session): Session to install the simulator in
+        """
+        session.events.register('provide-client-params', self.capture_params)
+        session.events.register('before-call', self.respond)
+
+    def capture_params(self, params, context, **kwargs):
+        context['simulatorParams'] = dict(params)
+
+    def respond(self, model, context, **kwargs):
+        service = model.service_model.service_name
+        operation = model.name
+        region = context.get('client_region') or 'us-east-1'
+        params = context.get('simulatorParams', {})
+        with self.lock:
+            self.calls[service + "." + operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        for attempt in range(self.maxAttempts):
+            with self.lock:
+                throttled = self.rng.random() < self.throttleRate
+                if throttled:
+                    self.throttled += 1
+            if not throttled:
+                break
+            if attempt == self.maxAttempts - 1:
+                with self.lock:
+                    self.failed += 1
+                return self.error(400, 'Throttling', 'Rate exceeded', attempt)
+            time.sleep(self.rng.random() * self.retryDelay * 2 ** attempt + self.latency)
+        handler = getattr(self, "%s_%s" % (service.replace("-", "_"), operation), None)
+        if handler is None:
+            return self.error(400, 'InvalidAction', "The simulator does not implement " + service + "." + operation)
+        try:
+            response = self.paginate(service, operation, region, params, handler)
+        except SimulatedError as e:
+            return self.error(e.status, e.code, e.message, attempt)
+        response.setdefault('ResponseMetadata', {'HTTPStatusCode': 200, 'RequestId': 'simulator', 'HTTPHeaders': {}, 'RetryAttempts': attempt})
+        return AWSResponse(None, 200, {}, None), response
+
+    def error(self, status, code, message, retries=0):
+        parsed = {'Error': {'Code': code, 'Message': message},
+                  'ResponseMetadata': {'HTTPStatusCode': status, 'RequestId': 'simulator', 'HTTPHeaders': {}, 'RetryAttempts': retries}}
+        return AWSResponse(None, status, {}, None), parsed
+
+    def paginate(self, service, operation, region, params, handler):
+        """Answer a call, with the page selected by the pagination parameters if the operation is paginated
+
+        The full result of a paginated operation is kept, so the handler runs once and not once per page.
+        """
+        key = (service, operation)
+        if key not in self.paginators:
+            try:
+                self.paginators[key] = self.loader.get_paginator_model(service).get_paginator(operation)
+            except Exception:
+                self.paginators[key] = None
+        config = self.paginators[key]
+        if config is None:
+            return handler(region, params)
+        resultKeys = config['result_key'] if isinstance(config['result_key'], list) else [config['result_key']]
+        inputToken = config['input_token'] if isinstance(config['input_token'], str) else config['input_token'][0]
+        outputToken = config['output_token'] if isinstance(config['output_token'], str) else config['output_token'][0]
+        filterKey = (service, operation, region, json.dumps(dict((k, v) for k, v in params.items() if k not in (inputToken, config.get('limit_key'))), sort_keys=True, default=str))
+        with self.lock:
+            sequence = self.sequences.get(filterKey)
+        if sequence is None:
+            response = handler(region, params)
+            sequence = [(k, n) for k in resultKeys for n in response.get(k, [])]
+            with self.lock:
+                self.sequences[filterKey] = sequence
+        response = dict()
+        start = int(params.get(inputToken) or 0)
+        size = int(params.get(config.get('limit_key')) or DEFAULT_PAGE_SIZES.get(service, 100))
+        page = sequence[start:start + size]
+        for k in resultKeys:
+            response[k] = [n for kind, n in page if kind == k]
+        more = start + size < len(sequence)
+        if more:
+            response[outputToken] = str(start + size)
+        if 'more_results' in config:
+            response[config['more_results']] = more
+        if service == 'iam':
+            # botocore decodes IAM policy documents in place, later pages must still be encoded
+            response = copy_structure(response)
+        return response
+
+    # --- STS ---
+
+    def sts_GetCallerIdentity(self, region, params):
+        return {'UserId': 'AIDASIMULATOR', 'Account': self.account.account, 'Arn': self.account.arn('iam', 'user/simulator')}
+
+    # --- IAM ---
+
+    def iam_GenerateCredentialReport(self, region, params):
+        return {'State': 'COMPLETE'}
+
+    def iam_GetCredentialReport(self, region, params):
+        return {'Content': self.account.credentialReport, 'ReportFormat': 'text/csv', 'GeneratedTime': self.account.date(self.account.now)}
+
+    def iam_GetAccountPasswordPolicy(self, region, params):
+        return {'PasswordPolicy': {'MinimumPasswordLength': 14, 'RequireSymbols': True, 'RequireNumbers': True,
+                                   'RequireUppercaseCharacters': True, 'RequireLowercaseCharacters': False,
+                                   'AllowUsersToChangePassword': True, 'ExpirePasswords': True, 'MaxPasswordAge': 90,
+                                   'PasswordReusePrevention': 24, 'HardExpiry': False}}
+
+    def iam_GetAccountSummary(self, region, params):
+        return {'SummaryMap': {'AccountMFAEnabled': 1, 'Users': len(self.account.users), 'Policies': len(self.account.policies)}}
+
+    def iam_ListVirtualMFADevices(self, region, params):
+        return {'VirtualMFADevices': [{'SerialNumber': self.account.arn('iam', 'mfa/user00000')}], 'IsTruncated': False}
+
+    def iam_GetAccountAuthorizationDetails(self, region, params):
+        response = {'IsTruncated': False}
+        for kind, item in self.account.authorizationDetails:
+            response.setdefault(kind, []).append(item)
+        return response
+
+    def iam_ListAccessKeys(self, region, params):
+        if params['UserName'] not in self.account.userKeys:
+            raise SimulatedError(404, 'NoSuchEntity', "The user with name " + params['UserName'] + " cannot be found.")
+        return {'AccessKeyMetadata': [{'UserName': params['UserName'], 'AccessKeyId': n['id'], 'Status': 'Active' if n['active'] else 'Inactive',
+                                       'CreateDate': self.account.date(n['rotated'])} for n in self.account.userKeys[params['UserName']]],
+                'IsTruncated': False}
+
+    # --- EC2 ---
+
+    def ec2_DescribeRegions(self, region, params):
+        return {'Regions': [{'RegionName': n, 'Endpoint': "ec2." + n + ".amazonaws.com", 'OptInStatus': 'opt-in-not-required'} for n in self.account.regions]}
+
+    def filters(self, params):
+        return dict((n['Name'], set(n['Values'])) for n in params.get('Filters', []))
+
+    def ec2_DescribeSecurityGroups(self, region, params):
+        return {'SecurityGroups': self.account.region(region)['SecurityGroups']}
+
+    def ec2_DescribeVpcs(self, region, params):
+        states = self.filters(params).get('state')
+        return {'Vpcs': [n for n in self.account.region(region)['Vpcs'] if states is None or n['State'] in states]}
+
+    def ec2_DescribeFlowLogs(self, region, params):
+        resources = self.filters(params).get('resource-id')
+        return {'FlowLogs': [n for n in self.account.region(region)['FlowLogs'] if resources is None or n['ResourceId'] in resources]}
+
+    def ec2_DescribeRouteTables(self, region, params):
+        return {'RouteTables': self.account.region(region)['RouteTables']}
+
+    def ec2_DescribeInstances(self, region, params):
+        states = self.filters(params).get('instance-state-name')
+        reservations = []
+        for n in self.account.region(region)['Reservations']:
+            instances = [m for m in n['Instances'] if states is None or m['State']['Name'] in states]
+            if instances:
+                reservations.append(dict(n, Instances=instances))
+        return {'Reservations': reservations}
+
+    # --- CloudTrail, S3, CloudWatch Logs, CloudWatch, SNS ---
+
+    def cloudtrail_ListTrails(self, region, params):
+        return {'Trails': [{'TrailARN': n['TrailARN'], 'Name': n['Name'], 'HomeRegion': n['HomeRegion']} for n in self.account.trails]}
+
+    def cloudtrail_DescribeTrails(self, region, params):
+        names = params.get('trailNameList')
+        if names:
+            return {'trailList': [self.account.trailsByArn[n] for n in names if n in self.account.trailsByArn]}
+        return {'trailList': [n for n in self.account.trails if n['HomeRegion'] == region or n['IsMultiRegionTrail']]}
+
+    def cloudtrail_GetTrailStatus(self, region, params):
+        if params['Name'] not in self.account.trailLogging:
+            raise SimulatedError(400, 'TrailNotFoundException', "Unknown trail: " + params['Name'])
+        return {'IsLogging': self.account.trailLogging[params['Name']], 'LatestDeliveryTime': self.account.date(self.account.now)}
+
+    def bucket_region(self, params):
+        if params['Bucket'] not in self.account.bucketRegions:
+            raise SimulatedError(404, 'NoSuchBucket', 'The specified bucket does not exist')
+        return self.account.bucketRegions[params['Bucket']]
+
+    def s3_GetBucketLocation(self, region, params):
+        location = self.bucket_region(params)
+        return {'LocationConstraint': None if location == 'us-east-1' else location}
+
+    def s3_GetBucketAcl(self, region, params):
+        self.bucket_region(params)
+        owner = {'ID': 'simulator', 'DisplayName': 'simulator'}
+        return {'Owner': owner, 'Grants': [{'Grantee': dict(owner, Type='CanonicalUser'), 'Permission': 'FULL_CONTROL'}]}
+
+    def s3_GetBucketLogging(self, region, params):
+        if self.buckets_logged().get(params['Bucket']):
+            return {'LoggingEnabled': {'TargetBucket': 'access-logs', 'TargetPrefix': params['Bucket'] + "/"}}
+        self.bucket_region(params)
+        return {}
+
+    def buckets_logged(self):
+        return dict((n, i % 2 == 0) for i, n in enumerate(self.account.buckets))
+
+    def s3_GetBucketPolicyStatus(self, region, params):
+        self.bucket_region(params)
+        return {'PolicyStatus': {'IsPublic': False}}
+
+    def s3_PutObject(self, region, params):
+        return {'ETag': '"simulator"'}
+
+    def s3_GetObject(self, region, params):
+        raise SimulatedError(404, 'NoSuchKey', 'The specified key does not exist.')
+
+    def s3_CreateMultipartUpload(self, region, params):
+        return {'Bucket': params['Bucket'], 'Key': params['Key'], 'UploadId': 'simulator'}
+
+    def s3_UploadPart(self, region, params):
+        return {'ETag': '"simulator"'}
+
+    def s3_CompleteMultipartUpload(self, region, params):
+        return {'Bucket': params['Bucket'], 'Key': params['Key'], 'ETag': '"simulator"'}
+
+    def logs_DescribeMetricFilters(self, region, params):
+        return {'metricFilters': self.account.region(region)['MetricFilters'].get(params.get('logGroupName'), [])}
+
+    def cloudwatch_DescribeAlarms(self, region, params):
+        alarms = [n for m in sorted(self.account.region(region)['Alarms'].items()) for n in m[1]]
+        if params.get('AlarmNames'):
+            alarms = [n for n in alarms if n['AlarmName'] in params['AlarmNames']]
+        return {'MetricAlarms': alarms, 'CompositeAlarms': []}
+
+    def cloudwatch_DescribeAlarmsForMetric(self, region, params):
+        return {'MetricAlarms': self.account.region(region)['Alarms'].get((params['Namespace'], params['MetricName']), [])}
+
+    def sns_ListSubscriptionsByTopic(self, region, params):
+        return {'Subscriptions': self.account.region(region)['Subscriptions'].get(params['TopicArn'], [])}
+
+    def sns_Publish(self, region, params):
+        return {'MessageId': 'simulator'}
+
+    # --- Config, KMS ---
+
+    def config_DescribeConfigurationRecorderStatus(self, region, params):
+        return {'ConfigurationRecordersStatus': [{'name': 'default', 'recording': self.account.region(region)['Recording'], 'lastStatus': 'SUCCESS'}]}
+
+    def config_DescribeConfigurationRecorders(self, region, params):
+        return {'ConfigurationRecorders': [{'name': 'default', 'roleARN': self.account.arn('iam', 'role/config'),
+                                            'recordingGroup': {'allSupported': True, 'includeGlobalResourceTypes': self.account.region(region)['GlobalEvents']}}]}
+
+    def config_DescribeDeliveryChannelStatus(self, region, params):
+        return {'DeliveryChannelsStatus': [{'name': 'default', 'configHistoryDeliveryInfo': {'lastStatus': 'SUCCESS'},
+                                            'configStreamDeliveryInfo': {'lastStatus': 'SUCCESS'}, 'configSnapshotDeliveryInfo': {'lastStatus': 'SUCCESS'}}]}
+
+    def config_PutEvaluations(self, region, params):
+        return {'FailedEvaluations': []}
+
+    def kms_ListKeys(self, region, params):
+        return {'Keys': self.account.region(region)['Keys']}
+
+    def kms_ListAliases(self, region, params):
+        return {'Aliases': self.account.region(region)['Aliases']}
+
+    def kms_key(self, region, params):
+        metadata = self.account.region(region)['KeyMetadata'].get(params['KeyId'])
+        if metadata is None:
+            raise SimulatedError(400, 'NotFoundException', "Key '" + params['KeyId'] + "' does not exist")
+        return metadata
+
+    def kms_GetKeyRotationStatus(self, region, params):
+        self.kms_key(region, params)
+        return {'KeyRotationEnabled': self.account.region(region)['Rotation'][params['KeyId']]}
+
+    def kms_DescribeKey(self, region, params):
+        return {'KeyMetadata': dict(self.kms_key(region, params))}
+
+
+class SimulatedError(Exception):
+    """Error response of a simulated call"""
+
+    def __init__(self, status, code, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def usage():
+    print("Run the checklist against a synthetic account:")
+    print("python " + sys.argv[0] + " [--scale small|large] [--latency <seconds>] [--throttle-rate <0..1>] [--seed <n>] [--report]")
+    print("    [--controls <ids>] [--sections <numbers>] [--result-cache]")
+
+
+if __name__ == '__main__':
+    scale = 'small'
+    latency = 0.0
+    throttleRate = 0.0
+    seed = 0
+    report = False
+    resultCache = False
+    event = dict()
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["scale=", "latency=", "throttle-rate=", "seed=", "report", "controls=", "sections=", "result-cache", "help"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit()
+            elif opt == "--scale":
+                if arg not in SCALES:
+                    raise ValueError("unknown scale " + arg)
+                scale = arg
+            elif opt == "--latency":
+                latency = float(arg)
+            elif opt == "--throttle-rate":
+                throttleRate = float(arg)
+            elif opt == "--seed":
+                seed = int(arg)
+            elif opt == "--report":
+                report = True
+            elif opt == "--result-cache":
+                resultCache = True
+            elif opt in ("--controls", "--sections"):
+                event[opt[2:]] = arg
+    except (getopt.GetoptError, ValueError) as e:
+        print("Error: " + str(e) + "\n")
+        usage()
+        sys.exit(2)
+
+    started = time.time()
+    simulator = Simulator(SyntheticAccount(scale, seed), latency=latency, throttle_rate=throttleRate, seed=seed)
+    generated = time.time()
+    if resultCache:
+        # Run twice in one cache directory, the second run reuses the control results stored by the first
+        checklist = load_checklist()
+        cacheDir = tempfile.mkdtemp(prefix="cis-simulator-")
+        try:
+            run_checklist(checklist, simulator.session(), report=report, event=event, cache_dir=cacheDir, result_cache="local")
+            stored = time.time()
+            firstCalls = sum(simulator.calls.values())
+            output = run_checklist(checklist, simulator.session(), report=report, event=event, cache_dir=cacheDir, result_cache="local")
+        finally:
+            shutil.rmtree(cacheDir, ignore_errors=True)
+        finished = time.time()
+        print(output)
+        sys.stderr.write("Generated account in %.2fs, ran checklist in %.2fs storing results (%d calls), %.2fs reusing them\n"
+                         % (generated - started, stored - generated, firstCalls, finished - stored))
+    else:
+        output = run_checklist(load_checklist(), simulator.session(), report=report, event=event)
+        finished = time.time()
+        print(output)
+        sys.stderr.write("Generated account in %.2fs, ran checklist in %.2fs\n" % (generated - started, finished - generated))
+    sys.stderr.write("%d calls, %d throttled attempts, %d calls failed after retries\n" % (sum(simulator.calls.values()), simulator.throttled, simulator.failed))
+    for name, count in simulator.calls.most_common():
+        sys.stderr.write("  %-50s %d\n" % (name, count))